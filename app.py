@@ -1,16 +1,53 @@
 import os
 import io
+import re
 import qrcode
+import qrcode.image.svg
+import hashlib
 import base64
 import csv
+import zipfile
+import zlib
+import gzip
+import json
+import time
+import random
+import threading
+import secrets
+import queue
+import heapq
+import bisect
+import atexit
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
 from datetime import datetime, timedelta
 from bson import ObjectId
-from flask import Flask, request, redirect, url_for, flash, render_template_string, session, Response
-from pymongo import MongoClient
+from bson.errors import InvalidId
+from flask import (Flask, request, redirect, url_for, flash, render_template, session, Response, send_file, send_from_directory, jsonify,
+                   stream_with_context, make_response, current_app, g, has_request_context)
+from flask.cli import AppGroup
+from jinja2 import ChoiceLoader, DictLoader
+from pymongo import monitoring, MongoClient, ReadPreference, IndexModel, UpdateOne, UpdateMany, DeleteOne, ASCENDING, DESCENDING
+from pymongo.read_preferences import Nearest, Secondary, SecondaryPreferred
+from pymongo.errors import BulkWriteError, CollectionInvalid, OperationFailure, WriteError
+from gridfs import GridFSBucket
 from dotenv import load_dotenv
 from werkzeug.security import generate_password_hash, check_password_hash
 import cloudinary
 import cloudinary.uploader
+import click
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow is optional; photos are then uploaded as received.
+    Image = None
+try:
+    import brotli
+except ImportError:  # Brotli is optional; responses are then gzipped only.
+    brotli = None
 
 # ##############################################################################
 # ## 1. HTML TEMPLATES AS PYTHON STRINGS
@@ -23,19 +60,69 @@ UI_STYLES = """
 <link rel="preconnect" href="https://fonts.googleapis.com">
 <link rel="preconnect" href="https://fonts.gstatic.com" crossorigin>
 <link href="https://fonts.googleapis.com/css2?family=Poppins:wght@300;400;600&display=swap" rel="stylesheet">
-<style>
-    :root { --primary-blue: #0d6efd; --dark-blue: #0a2e5c; --light-blue: #eef7ff; --page-bg: #f8f9fa; --card-bg: #ffffff; --text-dark: #212529; --text-light: #f8f9fa; --border-color: #dee2e6; --shadow: 0 4px 12px rgba(0,0,0,0.08); }
-    body { background-color: var(--page-bg); font-family: 'Poppins', sans-serif; color: var(--text-dark); }
-    .navbar-custom { background: linear-gradient(90deg, #0d6efd, #0a2e5c); box-shadow: var(--shadow); }
-    .card { border: none; box-shadow: var(--shadow); border-radius: 0.75rem; }
-    .card-header { background-color: var(--light-blue); border-bottom: 1px solid var(--border-color); font-weight: 600; color: var(--dark-blue); border-radius: 0.75rem 0.75rem 0 0 !important; }
-    .btn { border-radius: 0.5rem; font-weight: 600; }
-    .form-control, .form-select { border: 1px solid var(--border-color); border-radius: 0.5rem; }
-    .form-control:focus, .form-select:focus { border-color: var(--primary-blue); box-shadow: 0 0 0 0.25rem rgba(13, 110, 253, 0.25); }
-    .patient-list li { padding: 0.75rem; border-bottom: 1px solid var(--light-blue); }
-    .patient-list li:last-child { border-bottom: none; }
-    .photo-thumbnail { width: 40px; height: 40px; object-fit: cover; border-radius: 0.25rem; margin-right: 5px; }
-</style>
+<link rel="stylesheet" href="{{ asset_url('site.css') }}">
+"""
+
+# Served from /assets/ under content-hashed names (see STATIC ASSETS). Staff
+# pages load site.css after Bootstrap; patient pages, opened on phones over
+# poor connections, use no CDN at all: PATIENT_CRITICAL_CSS is inlined and
+# site.css (focus and validation states) loads without blocking first paint.
+SITE_CSS = """
+:root { --primary-blue: #0d6efd; --dark-blue: #0a2e5c; --light-blue: #eef7ff; --page-bg: #f8f9fa; --card-bg: #ffffff; --text-dark: #212529; --text-light: #f8f9fa; --border-color: #dee2e6; --shadow: 0 4px 12px rgba(0,0,0,0.08); }
+body { background-color: var(--page-bg); font-family: 'Poppins', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif; color: var(--text-dark); }
+.navbar-custom { background: linear-gradient(90deg, #0d6efd, #0a2e5c); box-shadow: var(--shadow); }
+.card { border: none; box-shadow: var(--shadow); border-radius: 0.75rem; }
+.card-header { background-color: var(--light-blue); border-bottom: 1px solid var(--border-color); font-weight: 600; color: var(--dark-blue); border-radius: 0.75rem 0.75rem 0 0 !important; }
+.btn { border-radius: 0.5rem; font-weight: 600; }
+.form-control, .form-select { border: 1px solid var(--border-color); border-radius: 0.5rem; }
+.form-control:focus, .form-select:focus { border-color: var(--primary-blue); outline: 0; box-shadow: 0 0 0 0.25rem rgba(13, 110, 253, 0.25); }
+.patient-list li { padding: 0.75rem; border-bottom: 1px solid var(--light-blue); }
+.patient-list li:last-child { border-bottom: none; }
+.photo-thumbnail { width: 40px; height: 40px; object-fit: cover; border-radius: 0.25rem; margin-right: 5px; }
+.icon { width: 1em; height: 1em; vertical-align: -0.125em; fill: none; stroke: currentColor; stroke-width: 2; stroke-linecap: round; stroke-linejoin: round; }
+.btn-primary:hover, .btn-primary:focus { background-color: #0b5ed7; border-color: #0a58ca; }
+.was-validated .form-control:valid { border-color: #198754; }
+.was-validated .form-control:invalid { border-color: #dc3545; }
+.was-validated .form-control:invalid:focus { box-shadow: 0 0 0 0.25rem rgba(220, 53, 69, 0.25); }
+"""
+
+PATIENT_CRITICAL_CSS = """
+:root { --primary-blue: #0d6efd; --dark-blue: #0a2e5c; --light-blue: #eef7ff; --page-bg: #f8f9fa; --border-color: #dee2e6; --shadow: 0 4px 12px rgba(0,0,0,0.08); }
+*, ::before, ::after { box-sizing: border-box; }
+body { margin: 0; background-color: var(--page-bg); font-family: 'Poppins', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif; font-size: 1rem; line-height: 1.5; color: #212529; -webkit-text-size-adjust: 100%; }
+h1, h3 { margin: 0 0 0.5rem; font-weight: 500; line-height: 1.2; }
+h3 { font-size: calc(1.3rem + 0.6vw); }
+p { margin: 0 0 1rem; }
+hr { margin: 1rem 0; border: 0; border-top: 1px solid; opacity: 0.25; }
+.container { width: 100%; max-width: 1140px; margin: 0 auto; padding: 0 0.75rem; }
+.row { display: flex; flex-wrap: wrap; justify-content: center; margin: 0 -0.75rem; }
+.col-md-6 { width: 100%; padding: 0 0.75rem; }
+@media (min-width: 768px) { .col-md-6 { width: 50%; } }
+.card { background: #fff; box-shadow: var(--shadow); border-radius: 0.75rem; }
+.card-header { padding: 0.5rem 1rem; background-color: var(--light-blue); border-bottom: 1px solid var(--border-color); font-weight: 600; color: var(--dark-blue); border-radius: 0.75rem 0.75rem 0 0; }
+.card-body { padding: 1.5rem; }
+.form-label { display: inline-block; margin-bottom: 0.5rem; }
+.form-control { display: block; width: 100%; padding: 0.375rem 0.75rem; font: inherit; color: inherit; background: #fff; border: 1px solid var(--border-color); border-radius: 0.5rem; }
+.btn { display: inline-block; width: 100%; margin-top: 1rem; padding: 0.375rem 0.75rem; font: inherit; font-weight: 600; color: #fff; background-color: var(--primary-blue); border: 1px solid var(--primary-blue); border-radius: 0.5rem; cursor: pointer; }
+.mb-3 { margin-bottom: 1rem; }
+.me-2 { margin-right: 0.5rem; }
+.text-center { text-align: center; }
+.display-4 { font-size: calc(1.475rem + 2.7vw); font-weight: 300; }
+.lead { font-size: 1.25rem; font-weight: 300; }
+.icon { width: 1em; height: 1em; vertical-align: -0.125em; fill: none; stroke: currentColor; stroke-width: 2; stroke-linecap: round; stroke-linejoin: round; }
+.icon-2x { width: 2em; height: 2em; }
+"""
+
+ICON_SPRITE = """<svg xmlns="http://www.w3.org/2000/svg">
+<symbol id="user-plus" viewBox="0 0 24 24"><circle cx="9" cy="7" r="4"/><path d="M2 21v-1a6 6 0 0 1 6-6h2a6 6 0 0 1 6 6v1M19 8v6M16 11h6"/></symbol>
+<symbol id="check-circle" viewBox="0 0 24 24"><circle cx="12" cy="12" r="10"/><path d="m7.5 12.5 3 3 6-6.5"/></symbol>
+</svg>
+"""
+
+PATIENT_STYLES = """
+<style>""" + PATIENT_CRITICAL_CSS + """</style>
+<link rel="preload" href="{{ asset_url('site.css') }}" as="style" onload="this.onload=null;this.rel='stylesheet'">
+<noscript><link rel="stylesheet" href="{{ asset_url('site.css') }}"></noscript>
 """
 
 ADMIN_LAYOUT_TEMPLATE = """
@@ -72,7 +159,7 @@ ADMIN_LAYOUT_TEMPLATE = """
         </div>
         {% endfor %}{% endif %}
     {% endwith %}
-    {{ content | safe }}
+    {% block content %}{% endblock %}
 </main>
 <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.3/dist/js/bootstrap.bundle.min.js"></script>
 </body></html>
@@ -134,12 +221,28 @@ ADMIN_TEMPLATE = """
                 </select>
             </div>
             <button type="submit" class="btn btn-primary w-100"><i class="fas fa-qrcode me-1"></i>Add & Gen QR</button>
+        </form></div></div>
+        <div class="card mt-4"><div class="card-header"><i class="fas fa-file-csv me-2"></i>Bulk Add QR Owners</div>
+        <div class="card-body"><form action="{{ url_for('bulk_add_medicals') }}" method="POST" enctype="multipart/form-data">
+            <div class="mb-3"><label class="form-label">CSV File</label><input type="file" name="csv_file" class="form-control" accept=".csv" required>
+                <small class="text-muted">Columns: name, username, password, center_id (optional)</small></div>
+            <div class="mb-3"><label class="form-label">Default Center</label>
+                <select class="form-select" name="center_id">
+                    <option value="">From CSV</option>
+                    {% for center in centers %}<option value="{{ center._id }}">{{ center.name }}</option>{% endfor %}
+                </select>
+            </div>
+            <div class="mb-3"><label class="form-label">Output</label>
+                <select class="form-select" name="output"><option value="zip">ZIP of PNG/SVG files</option><option value="sheet">Printable QR sheet</option></select>
+            </div>
+            <button type="submit" class="btn btn-primary w-100"><i class="fas fa-upload me-1"></i>Upload & Gen QRs</button>
         </form></div></div></div>
         <div class="col-lg-8">
             <div class="card mb-4"><div class="card-body">
                 <form method="GET" action="{{ url_for('admin_dashboard') }}" class="row g-2 align-items-end">
-                    <div class="col-sm-8"><label class="form-label">Registrations For:</label><input type="date" name="filter_date" class="form-control" value="{{ filter_date }}"></div>
-                    <div class="col-sm-4"><button type="submit" class="btn btn-info text-white w-100"><i class="fas fa-filter me-1"></i>Apply</button></div>
+                    <div class="col-sm-6"><label class="form-label">Registrations For:</label><input type="date" name="filter_date" class="form-control" value="{{ filter_date }}"></div>
+                    <div class="col-sm-3"><button type="submit" class="btn btn-info text-white w-100"><i class="fas fa-filter me-1"></i>Apply</button></div>
+                    <div class="col-sm-3"><a href="{{ url_for('admin_export', start=filter_date, end=filter_date) }}" class="btn btn-outline-secondary w-100"><i class="fas fa-file-export me-1"></i>Export</a></div>
                 </form>
             </div></div>
             {% for center in centers_with_medicals %}
@@ -151,9 +254,9 @@ ADMIN_TEMPLATE = """
                         <div class="col-7">
                             <h6 class="mb-1">{{ medical.name }}</h6>
                             <small class="text-muted d-block">Username: <strong>{{ medical.username or 'N/A' }}</strong></small>
-                            <span class="badge bg-primary rounded-pill">{{ medical.patients | length }} Registrations</span>
+                            <span class="badge bg-primary rounded-pill">{{ medical.count }} Registrations</span>
                         </div>
-                        <div class="col-2 text-center"><img src="data:image/png;base64,{{ medical.qr_code }}" alt="QR" style="width: 60px; height: 60px;"></div>
+                        <div class="col-2 text-center"><a href="{{ url_for('medical_qr', medical_id=medical._id, fmt='svg') }}" target="_blank"><img src="{{ url_for('medical_qr', medical_id=medical._id, fmt='png') }}" alt="QR" loading="lazy" style="width: 60px; height: 60px;"></a></div>
                         <div class="col-3 text-end">
                              <div class="btn-group-vertical btn-group-sm">
                                 <button class="btn btn-outline-secondary" type="button" data-bs-toggle="collapse" data-bs-target="#patients-{{ medical._id }}" title="View Patients"><i class="fas fa-users"></i></button>
@@ -175,11 +278,11 @@ ADMIN_TEMPLATE = """
                                 {% endif %}
                                 <br><small class="text-muted">Ultrasound: {{ patient.ultrasound_name or 'N/A' }}</small>
                                 <div>
-                                    {% if patient.get('photo_url_1') %}<a href="{{ patient.photo_url_1 }}" target="_blank"><img src="{{ patient.photo_url_1 }}" class="photo-thumbnail"></a>{% endif %}
-                                    {% if patient.get('photo_url_2') %}<a href="{{ patient.photo_url_2 }}" target="_blank"><img src="{{ patient.photo_url_2 }}" class="photo-thumbnail"></a>{% endif %}
+                                    {% with p = patient %}{% include 'patient_photos' %}{% endwith %}
                                 </div>
                             </li>
                             {% else %}<li><small class="text-muted">No registrations on this date.</small></li>{% endfor %}
+                            {% if medical.count > medical.patients|length %}<li><small class="text-muted">Showing the latest {{ medical.patients|length }} of {{ medical.count }}.</small></li>{% endif %}
                         </ul>
                     </div>
                 </div>
@@ -201,13 +304,20 @@ ADMIN_TEMPLATE = """
 ANALYTICS_TEMPLATE = """
 <div class="row g-4">
     <div class="col-12"><h4 class="mb-3"><i class="fas fa-chart-line me-2"></i>Analytics Dashboard</h4></div>
-    <div class="col-md-12"><div class="card"><div class="card-header">Daily Registrations (Last 30 Days)</div>
+    <div class="col-12"><div class="card"><div class="card-body">
+        <form method="GET" action="{{ url_for('analytics_dashboard') }}" class="row g-2 align-items-end">
+            <div class="col-sm-5"><label class="form-label">From:</label><input type="date" name="start" class="form-control" value="{{ start }}"></div>
+            <div class="col-sm-5"><label class="form-label">To:</label><input type="date" name="end" class="form-control" value="{{ end }}"></div>
+            <div class="col-sm-2"><button type="submit" class="btn btn-info text-white w-100"><i class="fas fa-filter me-1"></i>Apply</button></div>
+        </form>
+    </div></div></div>
+    <div class="col-md-12"><div class="card"><div class="card-header">Daily Registrations ({{ start }} to {{ end }})</div>
         <div class="card-body"><canvas id="dailyRegistrationsChart"></canvas></div>
     </div></div>
-    <div class="col-md-6"><div class="card"><div class="card-header">Top 5 Performing Centers</div>
+    <div class="col-md-6"><div class="card"><div class="card-header">Top 5 Performing Centers ({{ 'Selected Range' if ranged else 'All Time' }})</div>
         <div class="card-body"><canvas id="topCentersChart"></canvas></div>
     </div></div>
-    <div class="col-md-6"><div class="card"><div class="card-header">Top 5 Performing Medical Staff</div>
+    <div class="col-md-6"><div class="card"><div class="card-header">Top 5 Performing Medical Staff ({{ 'Selected Range' if ranged else 'All Time' }})</div>
         <div class="card-body"><canvas id="topMedicalsChart"></canvas></div>
     </div></div>
 </div>
@@ -245,18 +355,21 @@ OWNER_LOGIN_TEMPLATE = """
 
 OWNER_DASHBOARD_TEMPLATE = """
 <h4 class="mb-3">QR Owner Dashboard: <strong>{{ session['owner_name'] }}</strong></h4>
+<form id="bulk-form" action="{{ url_for('bulk_send_to_center') }}" method="POST"></form>
 <div class="card">
-    <div class="card-header">All Patient Registrations</div>
+    <div class="card-header d-flex justify-content-between align-items-center">All Patient Registrations
+        <div><button type="submit" form="bulk-form" class="btn btn-sm btn-success"><i class="fas fa-paper-plane me-1"></i>Send Selected</button>
+        <a href="{{ url_for('owner_export') }}" class="btn btn-sm btn-outline-secondary"><i class="fas fa-file-export me-1"></i>Export CSV</a></div></div>
     <div class="table-responsive">
         <table class="table table-hover mb-0 align-middle">
-            <thead><tr><th>Patient Details</th><th>Photos</th><th class="text-center">Action / Status</th></tr></thead>
+            <thead><tr><th><input type="checkbox" class="form-check-input" onclick="document.querySelectorAll('.bulk-select').forEach(c => c.checked = this.checked)"></th><th>Patient Details</th><th>Photos</th><th class="text-center">Action / Status</th></tr></thead>
             <tbody>
             {% for p in patients %}
             <tr>
+                <td>{% if p.center_visibility == 'hidden' %}<input type="checkbox" class="form-check-input bulk-select" name="patient_ids" value="{{ p._id }}" form="bulk-form">{% endif %}</td>
                 <td><strong>{{ p.name }}</strong><br><small class="text-muted">{{ p.phone }} | {{ p.ultrasound_name }}<br>Registered: {{ p.timestamp.strftime('%d-%b-%Y %H:%M') }} UTC</small></td>
                 <td>
-                    {% if p.get('photo_url_1') %}<a href="{{ p.photo_url_1 }}" target="_blank"><img src="{{ p.photo_url_1 }}" class="photo-thumbnail"></a>{% endif %}
-                    {% if p.get('photo_url_2') %}<a href="{{ p.photo_url_2 }}" target="_blank"><img src="{{ p.photo_url_2 }}" class="photo-thumbnail"></a>{% endif %}
+                    {% include 'patient_photos' %}
                 </td>
                 <td class="text-center">
                     {# MODIFIED: Show button only if not sent, otherwise show a status message #}
@@ -270,11 +383,17 @@ OWNER_DASHBOARD_TEMPLATE = """
                 </td>
             </tr>
             {% else %}
-            <tr><td colspan="3" class="text-center text-muted p-4">No registrations found.</td></tr>
+            <tr><td colspan="4" class="text-center text-muted p-4">No registrations found.</td></tr>
             {% endfor %}
             </tbody>
         </table>
     </div>
+    {% if after or next_cursor %}
+    <div class="card-footer d-flex justify-content-between">
+        {% if after %}<a href="{{ url_for('owner_dashboard', per_page=per_page) }}" class="btn btn-sm btn-outline-secondary"><i class="fas fa-angle-double-left me-1"></i>Newest</a>{% else %}<span></span>{% endif %}
+        {% if next_cursor %}<a href="{{ url_for('owner_dashboard', after=next_cursor, per_page=per_page) }}" class="btn btn-sm btn-outline-primary">Older<i class="fas fa-angle-right ms-1"></i></a>{% endif %}
+    </div>
+    {% endif %}
 </div>
 """
 
@@ -294,68 +413,117 @@ CENTER_DASHBOARD_TEMPLATE = """
 <div class="card mb-4"><div class="card-body">
     <form method="GET" action="{{ url_for('center_dashboard') }}" class="row g-2 align-items-end">
         <div class="col-sm-5"><label class="form-label">Search Name/Phone:</label><input type="text" name="search_query" class="form-control" value="{{ search_query or '' }}"></div>
-        <div class="col-sm-5"><label class="form-label">Registrations For:</label><input type="date" name="filter_date" class="form-control" value="{{ filter_date }}"></div>
+        <div class="col-sm-3"><label class="form-label">Registrations For:</label><input type="date" name="filter_date" class="form-control" value="{{ filter_date }}"></div>
+        <div class="col-sm-2"><div class="form-check mb-2"><input class="form-check-input" type="checkbox" name="all_dates" value="1" id="allDates" {{ 'checked' if all_dates }}><label class="form-check-label" for="allDates">All dates</label></div></div>
         <div class="col-sm-2"><button type="submit" class="btn btn-primary w-100"><i class="fas fa-search me-1"></i>Filter</button></div>
     </form>
 </div></div>
+<form id="bulk-form" action="{{ url_for('bulk_update_patient_status') }}" method="POST"></form>
 <div class="card">
-    <div class="card-header">Total Registrations on {{ filter_date }}: <span class="badge bg-primary rounded-pill fs-6">{{ patients|length }}</span></div>
+    <div class="card-header d-flex justify-content-between align-items-center"><span>Total Registrations {{ 'on all dates' if all_dates else 'on ' ~ filter_date }}: <span class="badge bg-primary rounded-pill fs-6">{{ total }}{{ '+' if total_capped }}</span></span>
+        <div><div class="btn-group btn-group-sm">
+            <button type="submit" form="bulk-form" name="new_status" value="Running" class="btn btn-info text-white"><i class="fas fa-play me-1"></i>Selected Running</button>
+            <button type="submit" form="bulk-form" name="new_status" value="Complete" class="btn btn-success"><i class="fas fa-check me-1"></i>Selected Complete</button>
+        </div>
+        <a href="{{ url_for('center_export', start=None if all_dates else filter_date, end=None if all_dates else filter_date) }}" class="btn btn-sm btn-outline-secondary"><i class="fas fa-file-export me-1"></i>Export CSV</a></div></div>
     <div class="table-responsive">
         <table class="table table-hover mb-0 align-middle">
-            <thead><tr><th>Patient</th><th>Photos</th><th>Status</th><th class="text-center">Action</th></tr></thead>
-            <tbody>
+            <thead><tr><th><input type="checkbox" class="form-check-input" onclick="document.querySelectorAll('.bulk-select').forEach(c => c.checked = this.checked)"></th><th>Patient</th><th>Photos</th><th>Status</th><th class="text-center">Action</th></tr></thead>
+            <tbody id="patient-rows">
             {% for p in patients %}
-            <tr>
-                <td><strong>{{ p.name }}</strong><br><small class="text-muted">{{ p.phone }} | {{ p.ultrasound_name }}</small></td>
-                <td>
-                    {% if p.get('photo_url_1') %}<a href="{{ p.photo_url_1 }}" target="_blank"><img src="{{ p.photo_url_1 }}" class="photo-thumbnail"></a>{% endif %}
-                    {% if p.get('photo_url_2') %}<a href="{{ p.photo_url_2 }}" target="_blank"><img src="{{ p.photo_url_2 }}" class="photo-thumbnail"></a>{% endif %}
-                </td>
-                <td>
-                    {% set status_color = 'warning' if p.status == 'Pending' else 'info' if p.status == 'Running' else 'success' %}
-                    <span class="badge bg-{{ status_color }} text-dark">{{ p.status }}</span>
-                </td>
-                <td class="text-center">
-                    {% if p.status != 'Complete' %}
-                    <div class="btn-group btn-group-sm">
-                    {% if p.status == 'Pending' %}
-                        <form action="{{ url_for('update_patient_status', patient_id=p._id) }}" method="POST" class="d-inline">
-                            <input type="hidden" name="new_status" value="Running"><button type="submit" class="btn btn-info text-white" title="Mark as Running"><i class="fas fa-play"></i></button>
-                        </form>
-                    {% endif %}
-                        <form action="{{ url_for('update_patient_status', patient_id=p._id) }}" method="POST" class="d-inline">
-                            <input type="hidden" name="new_status" value="Complete"><button type="submit" class="btn btn-success" title="Mark as Complete"><i class="fas fa-check"></i></button>
-                        </form>
-                    </div>
-                    {% else %}<span class="text-success"><i class="fas fa-check-circle"></i> Done</span>{% endif %}
-                </td>
-            </tr>
+            {% include 'center_patient_row' %}
             {% else %}
-            <tr><td colspan="4" class="text-center text-muted p-4">No registrations found.</td></tr>
+            <tr class="empty-row"><td colspan="5" class="text-center text-muted p-4">No registrations found.</td></tr>
             {% endfor %}
             </tbody>
         </table>
     </div>
+    {% if after or next_cursor %}
+    <div class="card-footer d-flex justify-content-between">
+        {% if after %}<a href="{{ url_for('center_dashboard', filter_date=filter_date, search_query=search_query, all_dates=all_dates or None, per_page=per_page) }}" class="btn btn-sm btn-outline-secondary"><i class="fas fa-angle-double-left me-1"></i>Newest</a>{% else %}<span></span>{% endif %}
+        {% if next_cursor %}<a href="{{ url_for('center_dashboard', filter_date=filter_date, search_query=search_query, all_dates=all_dates or None, after=next_cursor, per_page=per_page) }}" class="btn btn-sm btn-outline-primary">Older<i class="fas fa-angle-right ms-1"></i></a>{% endif %}
+    </div>
+    {% endif %}
 </div>
+{% if live_updates != 'off' %}
+<script>
+(() => {
+    const rows = document.getElementById('patient-rows'), prepend = {{ live_prepend|tojson }};
+    const apply = row => {
+        const holder = document.createElement('tbody');
+        holder.innerHTML = row.html.trim();
+        const existing = document.getElementById('patient-' + row.id);
+        if (existing) existing.replaceWith(holder.firstElementChild);
+        else if (prepend) { rows.querySelector('.empty-row')?.remove(); rows.prepend(holder.firstElementChild); }
+    };
+    let since = {{ changes_since|tojson }};
+    const poll = () => fetch("{{ url_for('center_changes', filter_date=filter_date)|safe }}&since=" + encodeURIComponent(since))
+        .then(r => r.json()).then(data => { data.rows.forEach(apply); since = data.since; return data.more; })
+        .catch(() => false).then(more => setTimeout(poll, more ? 0 : {{ poll_interval_ms }}));
+    if ({{ (live_updates == 'sse')|tojson }} && window.EventSource) {
+        const events = new EventSource("{{ url_for('center_stream', filter_date=filter_date)|safe }}");
+        events.onmessage = e => apply(JSON.parse(e.data));
+        events.addEventListener('unsupported', () => { events.close(); poll(); });
+    } else { poll(); }
+})();
+</script>
+{% endif %}
+"""
+
+# === SHARED PARTIALS ===
+PATIENT_PHOTOS_TEMPLATE = """
+{% if p.photo_status == 'processing' %}<span class="badge bg-secondary"><i class="fas fa-spinner fa-spin me-1"></i>Processing photos</span>
+{% elif p.photo_status == 'failed' %}<span class="badge bg-danger" title="The photo could not be uploaded after several attempts."><i class="fas fa-exclamation-triangle me-1"></i>Photo upload failed</span>{% endif %}
+{% if p.get('photo_url_1') %}<a href="{{ p.photo_url_1 }}" target="_blank"><img src="{{ p.get('photo_thumb_url_1') or p.photo_url_1 }}" class="photo-thumbnail" loading="lazy"></a>{% endif %}
+{% if p.get('photo_url_2') %}<a href="{{ p.photo_url_2 }}" target="_blank"><img src="{{ p.get('photo_thumb_url_2') or p.photo_url_2 }}" class="photo-thumbnail" loading="lazy"></a>{% endif %}
+"""
+
+CENTER_PATIENT_ROW_TEMPLATE = """
+<tr id="patient-{{ p._id }}">
+    <td>{% if p.status != 'Complete' %}<input type="checkbox" class="form-check-input bulk-select" name="patient_ids" value="{{ p._id }}" form="bulk-form">{% endif %}</td>
+    <td><strong>{{ p.name }}</strong><br><small class="text-muted">{{ p.phone }} | {{ p.ultrasound_name }}</small></td>
+    <td>
+        {% include 'patient_photos' %}
+    </td>
+    <td>
+        {% set status_color = 'warning' if p.status == 'Pending' else 'info' if p.status == 'Running' else 'success' %}
+        <span class="badge bg-{{ status_color }} text-dark">{{ p.status }}</span>
+    </td>
+    <td class="text-center">
+        {% if p.status != 'Complete' %}
+        <div class="btn-group btn-group-sm">
+        {% if p.status == 'Pending' %}
+            <form action="{{ url_for('update_patient_status', patient_id=p._id) }}" method="POST" class="d-inline">
+                <input type="hidden" name="new_status" value="Running"><button type="submit" class="btn btn-info text-white" title="Mark as Running"><i class="fas fa-play"></i></button>
+            </form>
+        {% endif %}
+            <form action="{{ url_for('update_patient_status', patient_id=p._id) }}" method="POST" class="d-inline">
+                <input type="hidden" name="new_status" value="Complete"><button type="submit" class="btn btn-success" title="Mark as Complete"><i class="fas fa-check"></i></button>
+            </form>
+        </div>
+        {% else %}<span class="text-success"><i class="fas fa-check-circle"></i> Done</span>{% endif %}
+    </td>
+</tr>
 """
 
 # === PATIENT TEMPLATES ===
 REGISTER_TEMPLATE = """
 <!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0"><title>Patient Registration</title>
-""" + UI_STYLES + """
+""" + PATIENT_STYLES + """
 <style>body{padding-top:2rem;}</style></head>
-<body><main class="container"><div class="row justify-content-center"><div class="col-md-6"><div class="card">
-    <div class="card-header text-center"><h3><i class="fas fa-user-plus me-2"></i>Patient Registration</h3></div>
-    <div class="card-body p-4">
+<body><main class="container"><div class="row"><div class="col-md-6"><div class="card">
+    <div class="card-header text-center"><h3><svg class="icon me-2" aria-hidden="true"><use href="{{ asset_url('icons.svg') }}#user-plus"></use></svg>Patient Registration</h3></div>
+    <div class="card-body">
         <p class="text-center">Registering with <strong>{{ medical.name }}</strong> at <strong>{{ center.name }}</strong>.</p>
         <form method="POST" enctype="multipart/form-data" class="needs-validation" novalidate>
+            <input type="hidden" name="submission_key" value="{{ submission_key }}">
             <div class="mb-3"><label class="form-label">Full Name</label><input type="text" class="form-control" name="name" required></div>
             <div class="mb-3"><label class="form-label">Phone Number</label><input type="tel" class="form-control" name="phone" required minlength="10" maxlength="12" pattern="[0-9]{10,12}"></div>
             <div class="mb-3"><label class="form-label">Ultrasound Name</label><input type="text" class="form-control" name="ultrasound_name" required></div>
             <hr>
             <div class="mb-3"><label class="form-label">Upload Photo 1 (Optional)</label><input type="file" class="form-control" name="photo1" accept="image/*"></div>
             <div class="mb-3"><label class="form-label">Upload Photo 2 (Optional)</label><input type="file" class="form-control" name="photo2" accept="image/*"></div>
-            <button type="submit" class="btn btn-primary w-100 mt-3">Submit Registration</button>
+            <button type="submit" class="btn btn-primary">Submit Registration</button>
         </form>
     </div></div></div></div>
 </main>
@@ -366,127 +534,1185 @@ REGISTER_TEMPLATE = """
 """
 SUCCESS_TEMPLATE = """
 <!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><meta name="viewport" content="width=device-width, initial-scale=1.0"><title>Success</title>
-""" + UI_STYLES + """
+""" + PATIENT_STYLES + """
 <style>body{display:flex;align-items:center;justify-content:center;height:100vh;text-align:center;}</style></head>
 <body><div>
-<h1 class="display-4" style="color:var(--primary-blue);"><i class="fas fa-check-circle fa-2x"></i><br>Registration Successful!</h1>
+<h1 class="display-4" style="color:var(--primary-blue);"><svg class="icon icon-2x" aria-hidden="true"><use href="{{ asset_url('icons.svg') }}#check-circle"></use></svg><br>Registration Successful!</h1>
 <p class="lead">Thank you. Your information has been submitted for review.</p>
 </div></body></html>
 """
 
+QR_SHEET_TEMPLATE = """
+<!DOCTYPE html><html lang="en"><head><meta charset="UTF-8"><title>QR Sheet</title>
+""" + UI_STYLES + """
+<style>
+    .qr-sheet { display: grid; grid-template-columns: repeat(3, 1fr); gap: 1rem; }
+    .qr-tile { border: 1px dashed var(--border-color); padding: 1rem; text-align: center; page-break-inside: avoid; }
+    .qr-tile img { width: 100%; max-width: 220px; }
+    @media print { .no-print { display: none; } }
+</style></head>
+<body><main class="container py-4">
+    <div class="no-print mb-3">
+        <h4>{{ created|length }} QR Owners Created</h4>
+        {% if failures %}<div class="alert alert-warning"><strong>{{ failures|length }} rows failed:</strong>
+            <ul class="mb-0">{% for f in failures %}<li>Row {{ f.row }} ({{ f.username or 'no username' }}): {{ f.reason }}</li>{% endfor %}</ul></div>{% endif %}
+        <button class="btn btn-primary" onclick="window.print()"><i class="fas fa-print me-1"></i>Print</button>
+    </div>
+    <div class="qr-sheet">
+        {% for m in created %}
+        <div class="qr-tile"><img src="data:image/png;base64,{{ m.png_b64 }}" alt="QR"><h6 class="mt-2 mb-0">{{ m.name }}</h6><small class="text-muted">{{ m.username }}</small></div>
+        {% endfor %}
+    </div>
+</main></body></html>
+"""
+
 # ##############################################################################
 # ## 2. APPLICATION SETUP & HELPERS
 # ##############################################################################
 load_dotenv()
-app = Flask(__name__)
-app.secret_key = os.getenv("ADMIN_KEY")
+logger = logging.getLogger(__name__)
+
+# Importing this module never touches the network. Routes and CLI commands are
+# collected here and bound in `create_app()`; the Mongo client (and everything
+# hanging off it) is created lazily, once per process, so a pre-fork server
+# such as `gunicorn --preload 'app:create_app()'` never shares sockets across
+# workers.
+ROUTES = []
+cli = AppGroup(__name__)
+
+def route(rule, **options):
+    def decorator(view):
+        ROUTES.append((rule, view, options))
+        return view
+    return decorator
+
+def default_config():
+    return {
+        'SECRET_KEY': os.getenv("ADMIN_KEY"),
+        'MONGO_URI': os.getenv("MONGO_URI"),
+        'MAX_CONTENT_LENGTH': int(os.getenv("MAX_CONTENT_LENGTH", 32 * 1024 * 1024)),  # request bodies: photos, bulk CSV imports
+        'MONGO_MAX_POOL_SIZE': int(os.getenv("MONGO_MAX_POOL_SIZE", 50)),
+        'MONGO_MIN_POOL_SIZE': int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+        'MONGO_SERVER_SELECTION_TIMEOUT_MS': int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        'MONGO_CONNECT_TIMEOUT_MS': int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000)),
+        'MONGO_SOCKET_TIMEOUT_MS': int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+        'MONGO_WAIT_QUEUE_TIMEOUT_MS': int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)),
+        'MONGO_COMPRESSORS': os.getenv("MONGO_COMPRESSORS", "zlib"),  # comma-separated; '' disables wire compression
+        'CLOUDINARY_CLOUD_NAME': os.getenv("CLOUDINARY_CLOUD_NAME"),
+        'CLOUDINARY_API_KEY': os.getenv("CLOUDINARY_API_KEY"),
+        'CLOUDINARY_API_SECRET': os.getenv("CLOUDINARY_API_SECRET"),
+    }
+
+def mongo_client_options(config):
+    options = {
+        'maxPoolSize': config['MONGO_MAX_POOL_SIZE'], 'minPoolSize': config['MONGO_MIN_POOL_SIZE'],
+        'serverSelectionTimeoutMS': config['MONGO_SERVER_SELECTION_TIMEOUT_MS'],
+        'connectTimeoutMS': config['MONGO_CONNECT_TIMEOUT_MS'], 'socketTimeoutMS': config['MONGO_SOCKET_TIMEOUT_MS'],
+        'waitQueueTimeoutMS': config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+    }
+    if config['MONGO_COMPRESSORS']: options['compressors'] = config['MONGO_COMPRESSORS']
+    return options
+
+class ProcessLocal:
+    """Attribute proxy to an object built on first use and rebuilt in any process that did not build it (i.e. after a fork)."""
+    instances = []
+
+    def __init__(self, factory, close=None):
+        self._factory, self._close, self._lock = factory, close, threading.Lock()
+        self._pid, self._target = None, None
+        ProcessLocal.instances.append(self)
 
-cloudinary.config(cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"), api_key=os.getenv("CLOUDINARY_API_KEY"), api_secret=os.getenv("CLOUDINARY_API_SECRET"))
-client = MongoClient(os.getenv("MONGO_URI"))
-db = client.get_database()
-centers_collection, medicals_collection, patients_collection = db.centers, db.medicals, db.patients
+    def target(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid(): self._target, self._pid = self._factory(), os.getpid()
+        return self._target
+
+    def reset(self):
+        """Drop the object; it is closed only if this process created it."""
+        with self._lock:
+            target, owned = self._target, self._pid == os.getpid()
+            self._pid, self._target = None, None
+        if owned and target is not None and self._close: self._close(target)
+
+    def __getattr__(self, name): return getattr(self.target(), name)
+    def __getitem__(self, key): return self.target()[key]
+
+    @classmethod
+    def after_fork(cls):
+        # A lock held by another thread at fork time would never be released in the child.
+        for proxy in cls.instances: proxy._lock = threading.Lock()
+
+os.register_at_fork(after_in_child=ProcessLocal.after_fork)
+
+mongo_settings = {'host': os.getenv("MONGO_URI"), **mongo_client_options(default_config())}
+client = ProcessLocal(lambda: MongoClient(**mongo_settings, event_listeners=[command_metrics]), close=lambda c: c.close())
+db = ProcessLocal(lambda: client.get_database())
+centers_collection, medicals_collection, patients_collection = (ProcessLocal(lambda n=n: db[n]) for n in ('centers', 'medicals', 'patients'))
+patients_archive_collection = ProcessLocal(lambda: db['patients_archive'])
+photo_blobs_collection = ProcessLocal(lambda: db['photo_blobs'])
+daily_registrations_collection, analytics_counters_collection = (ProcessLocal(lambda n=n: db[n]) for n in ('daily_registrations', 'analytics_counters'))
+photo_spool = ProcessLocal(lambda: GridFSBucket(db.target(), bucket_name='photo_spool'))
+# Each open change stream keeps a connection checked out between events, so
+# streams get their own small client and never drain the main pool.
+stream_client = ProcessLocal(lambda: MongoClient(**{**mongo_settings, 'maxPoolSize': MAX_LIVE_STREAMS, 'minPoolSize': 0},
+                                                 event_listeners=[command_metrics]), close=lambda c: c.close())
+stream_patients = ProcessLocal(lambda: stream_client.get_database()['patients'])
 ADMIN_USER, ADMIN_PASSWORD = os.getenv("ADMIN_USER"), os.getenv("ADMIN_PASSWORD")
 HOST_URL = os.getenv("HOST_URL")
+QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", 1024))
+BULK_WORKERS = int(os.getenv("BULK_WORKERS", os.cpu_count() or 1))
+ROLLUP_RECENT_LIMIT = int(os.getenv("ROLLUP_RECENT_LIMIT", 50))
+PAGE_SIZE, MAX_PAGE_SIZE = int(os.getenv("PAGE_SIZE", 50)), int(os.getenv("MAX_PAGE_SIZE", 200))
+ALL_DATES_COUNT_LIMIT = int(os.getenv("ALL_DATES_COUNT_LIMIT", 1000))  # center dashboard "all dates" totals stop counting here and show "N+"
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+REGISTRATION_CACHE_SIZE = int(os.getenv("REGISTRATION_CACHE_SIZE", 2048))
+REGISTRATION_CACHE_TTL = float(os.getenv("REGISTRATION_CACHE_TTL", 300))
+LIVE_UPDATES = os.getenv("LIVE_UPDATES", "poll")  # 'poll', 'sse' (change streams, polling fallback; needs threaded or ASGI workers) or 'off'
+MAX_LIVE_STREAMS = int(os.getenv("MAX_LIVE_STREAMS", 16))  # open SSE streams per process; further dashboards poll
+POLL_INTERVAL_MS = int(os.getenv("POLL_INTERVAL_MS", 15000))
+SSE_HEARTBEAT_SECONDS = int(os.getenv("SSE_HEARTBEAT_SECONDS", 20))
+UPLOAD_BACKEND = os.getenv("UPLOAD_BACKEND", "cloudinary")  # 'cloudinary' or 'local' (fake backend for dev/tests)
+LOCAL_UPLOAD_DIR = os.path.abspath(os.getenv("LOCAL_UPLOAD_DIR", "uploads"))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", 4))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", 5))
+UPLOAD_BACKOFF_SECONDS = float(os.getenv("UPLOAD_BACKOFF_SECONDS", 1.0))
+PHOTO_MAX_DIMENSION = int(os.getenv("PHOTO_MAX_DIMENSION", 1600))
+PHOTO_THUMB_DIMENSION = int(os.getenv("PHOTO_THUMB_DIMENSION", 160))
+PHOTO_QUALITY = int(os.getenv("PHOTO_QUALITY", 80))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 180))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 1000))
+PATIENT_WRITE_BUFFER = os.getenv("PATIENT_WRITE_BUFFER", "0") == "1"
+WRITE_BUFFER_MAX_BATCH = int(os.getenv("WRITE_BUFFER_MAX_BATCH", 100))
+WRITE_BUFFER_FLUSH_MS = float(os.getenv("WRITE_BUFFER_FLUSH_MS", 5))
+WRITE_BUFFER_TIMEOUT_SECONDS = float(os.getenv("WRITE_BUFFER_TIMEOUT_SECONDS", 30))  # longest a request waits for its batch
+SUBMISSION_CACHE_SIZE = int(os.getenv("SUBMISSION_CACHE_SIZE", 10000))
+SUBMISSION_CACHE_TTL = float(os.getenv("SUBMISSION_CACHE_TTL", 3600))
+READ_ROUTING = os.getenv("READ_ROUTING", "secondaryPreferred")  # 'secondaryPreferred', 'secondary', 'nearest' or 'primary' (off)
+READ_MAX_STALENESS_SECONDS = int(os.getenv("READ_MAX_STALENESS_SECONDS", 120))  # MongoDB's minimum is 90; -1 for no limit
+COMPRESS_RESPONSES = os.getenv("COMPRESS_RESPONSES", "1") == "1"
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", 1024))
+GZIP_LEVEL, BROTLI_QUALITY = int(os.getenv("GZIP_LEVEL", 6)), int(os.getenv("BROTLI_QUALITY", 5))  # for dynamic responses; assets use the maximum
+WSGI_THREADS = int(os.getenv("WSGI_THREADS", 32))  # ASGI mode: threads for WSGI-routed requests
+WSGI_STREAM_THREADS = int(os.getenv("WSGI_STREAM_THREADS", 256))  # ASGI mode: threads for SSE and streamed exports, one per open connection
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", 100))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # when set, /metrics requires "Authorization: Bearer <token>"
 
-def render_page(title, content, **context):
-    return render_template_string(ADMIN_LAYOUT_TEMPLATE, title=title, content=render_template_string(content, **context))
+# Every template constant is registered under a name and compiled once at
+# startup. Admin pages extend the layout through a `content` block so a request
+# is rendered in a single pass instead of page-then-layout.
+PAGE_TEMPLATES = {
+    'login': LOGIN_TEMPLATE, 'admin': ADMIN_TEMPLATE, 'analytics': ANALYTICS_TEMPLATE,
+    'owner_login': OWNER_LOGIN_TEMPLATE, 'owner_dashboard': OWNER_DASHBOARD_TEMPLATE,
+    'center_login': CENTER_LOGIN_TEMPLATE, 'center_dashboard': CENTER_DASHBOARD_TEMPLATE,
+}
+STANDALONE_TEMPLATES = {'register': REGISTER_TEMPLATE, 'success': SUCCESS_TEMPLATE, 'qr_sheet': QR_SHEET_TEMPLATE}
+PARTIAL_TEMPLATES = {'patient_photos': PATIENT_PHOTOS_TEMPLATE, 'center_patient_row': CENTER_PATIENT_ROW_TEMPLATE}
 
-def generate_qr_code_base64(data):
-    img = qrcode.make(data)
+def build_template_sources():
+    sources = {'admin_layout': ADMIN_LAYOUT_TEMPLATE, **STANDALONE_TEMPLATES, **PARTIAL_TEMPLATES}
+    for name, body in PAGE_TEMPLATES.items():
+        sources[name] = "{% extends 'admin_layout' %}{% block content %}" + body + "{% endblock %}"
+    return sources
+
+TEMPLATE_SOURCES = build_template_sources()
+
+def precompile_templates(app):
+    for name in TEMPLATE_SOURCES: app.jinja_env.get_template(name)
+
+def render_page(title, template_name, **context):
+    return render_template(template_name, title=title, **context)
+
+def render_qr_code(data, fmt='png'):
+    image_factory = qrcode.image.svg.SvgPathImage if fmt == 'svg' else None
+    img = qrcode.make(data, image_factory=image_factory)
     buffered = io.BytesIO()
     img.save(buffered)
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+    return buffered.getvalue()
+
+def generate_qr_code(data, fmt='png'):
+    with timed('qr_render_duration_seconds', format=fmt): return render_qr_code(data, fmt)
+
+def prepare_medical_row(job):
+    """Process-pool worker for bulk provisioning: hash the password and render both QR formats.
+
+    Render timings are returned with the images for the parent to record; a worker's own metrics never reach /metrics.
+    """
+    password, registration_url = job
+    images, seconds = {}, {}
+    for fmt in ('png', 'svg'):
+        started = time.perf_counter()
+        images[fmt] = render_qr_code(registration_url, fmt)
+        seconds[fmt] = time.perf_counter() - started
+    return generate_password_hash(password), images['png'], images['svg'], seconds
+
+def provision_medicals(rows, default_center_id=None):
+    """Create medicals from CSV rows in one insert_many.
+
+    Returns (created, failures); a bad row is reported in failures and never aborts the batch.
+    """
+    failures, candidates, seen = [], [], set()
+    for line, row in enumerate(rows, start=2):
+        row = {k.strip().lower(): (v or '').strip() for k, v in row.items() if k}
+        name, username, password = row.get('name'), row.get('username'), row.get('password')
+        center_id = row.get('center_id') or default_center_id
+        if not (name and username and password and center_id):
+            failures.append({'row': line, 'username': username, 'reason': "name, username, password and center_id are required"})
+        elif not ObjectId.is_valid(center_id):
+            failures.append({'row': line, 'username': username, 'reason': f"invalid center_id '{center_id}'"})
+        elif username in seen:
+            failures.append({'row': line, 'username': username, 'reason': "duplicate username in file"})
+        else:
+            seen.add(username)
+            candidates.append({'row': line, '_id': ObjectId(), 'name': name, 'username': username, 'password': password, 'center_id': ObjectId(center_id)})
+
+    center_ids = {c['_id'] for c in centers_collection.find({'_id': {'$in': list({c['center_id'] for c in candidates})}}, {'_id': 1})}
+    taken = {m['username'] for m in medicals_collection.find({'username': {'$in': list(seen)}}, {'username': 1})}
+    valid = []
+    for c in candidates:
+        if c['center_id'] not in center_ids: failures.append({'row': c['row'], 'username': c['username'], 'reason': "unknown center"})
+        elif c['username'] in taken: failures.append({'row': c['row'], 'username': c['username'], 'reason': "username already exists"})
+        else: valid.append(c)
+    if not valid: return [], sorted(failures, key=lambda f: f['row'])
+
+    jobs = [(c['password'], f"{HOST_URL}/register/{c['_id']}") for c in valid]
+    # forkserver: forking a threaded server process can copy held locks (Mongo pools, metrics) into the workers.
+    with ProcessPoolExecutor(max_workers=BULK_WORKERS, mp_context=multiprocessing.get_context('forkserver')) as pool:
+        prepared = list(pool.map(prepare_medical_row, jobs, chunksize=max(1, len(jobs) // (BULK_WORKERS * 4))))
+    for *_, seconds in prepared:
+        for fmt, elapsed in seconds.items(): metrics.observe('qr_render_duration_seconds', elapsed, format=fmt)
+
+    documents = [{'_id': c['_id'], 'name': c['name'], 'center_id': c['center_id'], 'username': c['username'], 'password': hashed}
+                 for c, (hashed, *_) in zip(valid, prepared)]
+    failed_indexes = set()
+    try:
+        medicals_collection.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get('writeErrors', []):
+            failed_indexes.add(error['index'])
+            reason = "username already exists" if error.get('code') == 11000 else error.get('errmsg', 'write failed')
+            failures.append({'row': valid[error['index']]['row'], 'username': valid[error['index']]['username'], 'reason': reason})
+
+    created = [{'_id': c['_id'], 'name': c['name'], 'username': c['username'], 'png': png, 'svg': svg}
+               for i, (c, (_, png, svg, _)) in enumerate(zip(valid, prepared)) if i not in failed_indexes]
+    return created, sorted(failures, key=lambda f: f['row'])
+
+def build_qr_zip(created, failures):
+    buffered = io.BytesIO()
+    with zipfile.ZipFile(buffered, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for m in created:
+            archive.writestr(f"{m['username']}.png", m['png'])
+            archive.writestr(f"{m['username']}.svg", m['svg'])
+        if failures:
+            report = io.StringIO()
+            writer = csv.DictWriter(report, fieldnames=['row', 'username', 'reason'])
+            writer.writeheader()
+            writer.writerows(failures)
+            archive.writestr("failures.csv", report.getvalue())
+    buffered.seek(0)
+    return buffered
+
+def render_qr_sheet(created, failures):
+    return render_template('qr_sheet', failures=failures, created=[
+        {'name': m['name'], 'username': m['username'], 'png_b64': base64.b64encode(m['png']).decode("utf-8")} for m in created])
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire `ttl` seconds after being stored."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl = maxsize, ttl
+        self.hits = self.misses = 0
+        self._entries, self._lock = OrderedDict(), threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry: del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize: self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock: self._entries.pop(key, None)
+
+    def invalidate_where(self, predicate):
+        with self._lock:
+            for key in [k for k, (_, value) in self._entries.items() if predicate(value)]: del self._entries[key]
+
+# Medical + center shown on the /register form, keyed by medical id. Admin
+# routes invalidate it in this process; the TTL bounds staleness in others.
+registration_cache = TTLCache(REGISTRATION_CACHE_SIZE, REGISTRATION_CACHE_TTL)
+
+def get_registration_context(medical_id):
+    context = registration_cache.get(medical_id)
+    if context is None:
+        medical = medicals_collection.find_one({'_id': ObjectId(medical_id)}, {'name': 1, 'center_id': 1})
+        if not medical: return None
+        context = (medical, centers_collection.find_one({'_id': medical['center_id']}, {'name': 1, 'address': 1}))
+        registration_cache.set(medical_id, context)
+    return context
+
+# Each rendered registration form carries a random submission key, stored on
+# the patient under a unique index. A resubmitted form (flaky Wi-Fi, double
+# taps) resolves to the first registration before any photo is spooled or
+# patient inserted; recently seen keys are answered from memory.
+SUBMISSION_KEY_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+recent_submissions = TTLCache(SUBMISSION_CACHE_SIZE, SUBMISSION_CACHE_TTL)
+
+def new_submission_key():
+    return secrets.token_urlsafe(18)
+
+def submission_key(form):
+    key = form.get('submission_key', '')
+    return key if SUBMISSION_KEY_PATTERN.match(key) else None
+
+def previous_submission(key):
+    """The patient id already registered under `key`, if any."""
+    if not key: return None
+    patient_id = recent_submissions.get(key)
+    if patient_id is None:
+        patient = patients_collection.find_one({'submission_key': key}, {'_id': 1})
+        if not patient: return None
+        patient_id = patient['_id']
+        recent_submissions.set(key, patient_id)
+    return patient_id
+
+def is_duplicate_key(error):
+    return isinstance(error, WriteError) and error.code == 11000
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def medical_qr_image(medical_id, fmt):
+    """QR bytes and strong ETag for a medical's registration link, rendered on demand."""
+    image = generate_qr_code(f"{HOST_URL}/register/{medical_id}", fmt)
+    return image, hashlib.sha256(image).hexdigest()[:32]
+
+# === METRICS ===
+# Per-process counters and histograms, rendered in the Prometheus text format
+# at /metrics. Mongo commands are timed by a CommandListener and tagged with
+# the Flask endpoint that issued them ('background' outside a request).
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+METRICS = {
+    'http_requests_total': ('counter', "HTTP requests by endpoint, method and status."),
+    'http_request_errors_total': ('counter', "HTTP requests answered with a 5xx."),
+    'http_request_duration_seconds': ('histogram', "Time to build the response (to first byte for streamed responses)."),
+    'mongo_command_duration_seconds': ('histogram', "MongoDB command round trips by command, collection and calling endpoint."),
+    'mongo_command_failures_total': ('counter', "MongoDB commands that returned an error."),
+    'photo_upload_duration_seconds': ('histogram', "Single photo upload attempts by storage backend."),
+    'qr_render_duration_seconds': ('histogram', "QR code renders by output format."),
+    'photo_dedup_hits_total': ('counter', "Spooled photos whose content was already uploaded; the stored URLs were reused."),
+    'photo_dedup_misses_total': ('counter', "Spooled photos uploaded because their content hash was new."),
+    'photo_dedup_bytes_saved_total': ('counter', "Bytes not sent to the upload backend thanks to deduplication."),
+    'patient_insert_batches_total': ('counter', "insert_many calls made by the patient write buffer."),
+    'patient_insert_batch_documents_total': ('counter', "Patients written through the write buffer (divide by batches for the mean batch size)."),
+    'http_compressed_responses_total': ('counter', "Responses sent gzip or brotli encoded, by encoding."),
+    'http_compression_bytes_saved_total': ('counter', "Response bytes not sent thanks to compression, by encoding."),
+}
+
+class MetricsRegistry:
+    def __init__(self): self.reset()
+
+    def reset(self):
+        self.lock, self.counters, self.histograms = threading.Lock(), {}, {}
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock: self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            buckets, total = self.histograms.get(key, ([0] * (len(LATENCY_BUCKETS) + 1), 0.0))
+            buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.histograms[key] = (buckets, total + seconds)
+
+    def render(self):
+        with self.lock: counters, histograms = dict(self.counters), {k: (list(b), t) for k, (b, t) in self.histograms.items()}
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+            if kind == 'counter':
+                lines += [f"{name}{metric_labels(labels)} {value}" for (n, labels), value in sorted(counters.items()) if n == name]
+                continue
+            for (n, labels), (buckets, total) in sorted(histograms.items()):
+                if n != name: continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), buckets):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{metric_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines += [f"{name}_sum{metric_labels(labels)} {total:.6f}", f"{name}_count{metric_labels(labels)} {cumulative}"]
+        return "\n".join(lines) + "\n"
+
+def metric_labels(labels):
+    if not labels: return ""
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+metrics = MetricsRegistry()
+os.register_at_fork(after_in_child=metrics.reset)
+
+@contextmanager
+def timed(name, **labels):
+    started = time.perf_counter()
+    try: yield
+    finally: metrics.observe(name, time.perf_counter() - started, **labels)
+
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is None: return response
+    labels = {'endpoint': request.endpoint or 'unmatched', 'method': request.method}
+    metrics.observe('http_request_duration_seconds', time.perf_counter() - started, **labels)
+    metrics.increment('http_requests_total', status=str(response.status_code), **labels)
+    if response.status_code >= 500: metrics.increment('http_request_errors_total', **labels)
+    return response
+
+def query_shape(value):
+    """A command with its literal values replaced by '?', so slow-query logs carry no patient data."""
+    if isinstance(value, dict): return {k: query_shape(v) for k, v in value.items() if k not in ('lsid', '$clusterTime', '$db')}
+    if isinstance(value, (list, tuple)): return [query_shape(v) for v in value[:3]]
+    return '?'
+
+class CommandMetrics(monitoring.CommandListener):
+    """Times every Mongo command and logs those slower than SLOW_QUERY_MS."""
+    def __init__(self): self.inflight = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str): collection = event.command.get('collection', '')
+        endpoint = (request.endpoint or 'unmatched') if has_request_context() else 'background'
+        self.inflight[(event.connection_id, event.request_id)] = (collection, endpoint, event.command)
+
+    def succeeded(self, event): self.finish(event, failed=False)
+    def failed(self, event): self.finish(event, failed=True)
+
+    def finish(self, event, failed):
+        collection, endpoint, command = self.inflight.pop((event.connection_id, event.request_id), ('', 'unknown', {}))
+        seconds, labels = event.duration_micros / 1e6, {'command': event.command_name, 'collection': collection, 'endpoint': endpoint}
+        metrics.observe('mongo_command_duration_seconds', seconds, **labels)
+        if failed: metrics.increment('mongo_command_failures_total', **labels)
+        if seconds * 1000 >= SLOW_QUERY_MS:
+            logger.warning("Slow query (%.1f ms): %s on %s from %s: %s", seconds * 1000, event.command_name, collection, endpoint,
+                           json.dumps(query_shape(command)))
+
+command_metrics = CommandMetrics()
+
+# === READ ROUTING ===
+# Writes and read-your-own-write paths (anything a redirect after a POST lands
+# on: center and medical lists, patient dashboards) stay on the primary.
+# Read-heavy work that tolerates a little lag (analytics, exports, the admin
+# rollup) goes through `stale_reads()` to secondaries no more than
+# READ_MAX_STALENESS_SECONDS behind. Standalone servers ignore the preference.
+STALE_READ_MODES = {'secondaryPreferred': SecondaryPreferred, 'secondary': Secondary, 'nearest': Nearest}
+
+def stale_read_preference():
+    if READ_ROUTING == 'primary': return ReadPreference.PRIMARY
+    return STALE_READ_MODES[READ_ROUTING](max_staleness=max(90, READ_MAX_STALENESS_SECONDS) if READ_MAX_STALENESS_SECONDS > 0 else -1)
+
+def stale_reads(collection):
+    return collection.with_options(read_preference=stale_read_preference())
+
+# === STATIC ASSETS AND COMPRESSION ===
+# Assets are served from /assets/<name>.<content hash>.<ext>, so they can be
+# cached forever: any edit changes the URL the templates emit. Each one is
+# compressed once at import; HTML and JSON are compressed per response.
+ASSET_SOURCES = {'site.css': ('text/css', SITE_CSS), 'icons.svg': ('image/svg+xml', ICON_SPRITE)}
+ASSET_MAX_AGE = 365 * 24 * 3600
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/plain', 'application/json', 'image/svg+xml'}
+
+def compress(data, encoding, best=False):
+    if encoding == 'br': return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+def preferred_encoding(accept_encodings):
+    """'br', 'gzip' or None for the request's Accept-Encoding; brotli wins ties."""
+    offered = [e for e in ('br', 'gzip') if (e != 'br' or brotli) and accept_encodings.quality(e) > 0]
+    return max(offered, key=accept_encodings.quality, default=None)
+
+def build_assets():
+    """(logical name -> fingerprinted name, fingerprinted name -> (mimetype, {encoding: body}))."""
+    names, assets = {}, {}
+    for name, (mimetype, source) in ASSET_SOURCES.items():
+        data = source.encode('utf-8')
+        stem, ext = name.rsplit('.', 1)
+        names[name] = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}.{ext}"
+        encodings = ('br', 'gzip') if brotli else ('gzip',)
+        assets[names[name]] = (mimetype, {'identity': data, **{e: compress(data, e, best=True) for e in encodings}})
+    return names, assets
+
+ASSET_NAMES, ASSETS = build_assets()
+
+def asset_url(name):
+    return f"/assets/{ASSET_NAMES[name]}"
+
+def compressed_body(data, mimetype, accept_encodings):
+    """(encoding, body) when a response is worth compressing for this client, else None."""
+    if not COMPRESS_RESPONSES or mimetype not in COMPRESSIBLE_TYPES or len(data) < COMPRESS_MIN_BYTES: return None
+    encoding = preferred_encoding(accept_encodings)
+    if not encoding: return None
+    body = compress(data, encoding)
+    metrics.increment('http_compressed_responses_total', encoding=encoding)
+    metrics.increment('http_compression_bytes_saved_total', len(data) - len(body), encoding=encoding)
+    return encoding, body
+
+def weaken_etag(response):
+    """A re-encoded body is not byte-identical to the one a strong ETag names; ETags stay weak once compressed."""
+    etag, weak = response.get_etag()
+    if etag and not weak: response.set_etag(etag, weak=True)
+
+def compress_response(response):
+    """after_request hook; streamed exports, files and already-encoded responses pass through untouched."""
+    if response.status_code != 200 or response.is_streamed or response.direct_passthrough or response.content_encoding: return response
+    if response.mimetype not in COMPRESSIBLE_TYPES: return response
+    response.vary.add('Accept-Encoding')
+    compressed = compressed_body(response.get_data(), response.mimetype, request.accept_encodings)
+    if compressed:
+        response.content_encoding = compressed[0]
+        response.set_data(compressed[1])
+        weaken_etag(response)
+    return response
+
+# === DASHBOARD PAGINATION ===
+# Dashboards page through patients by (timestamp, _id) descending and only load
+# the fields their templates show, so memory stays flat as history grows.
+OWNER_DASHBOARD_FIELDS = {'name': 1, 'phone': 1, 'ultrasound_name': 1, 'timestamp': 1, 'photo_url_1': 1, 'photo_url_2': 1, 'photo_thumb_url_1': 1, 'photo_thumb_url_2': 1, 'photo_status': 1, 'center_visibility': 1}
+CENTER_DASHBOARD_FIELDS = {'name': 1, 'phone': 1, 'ultrasound_name': 1, 'timestamp': 1, 'photo_url_1': 1, 'photo_url_2': 1, 'photo_thumb_url_1': 1, 'photo_thumb_url_2': 1, 'photo_status': 1, 'status': 1}
+
+def page_size_arg(args=None):
+    args = request.args if args is None else args
+    try: return max(1, min(int(args.get('per_page', PAGE_SIZE)), MAX_PAGE_SIZE))
+    except ValueError: return PAGE_SIZE
+
+def encode_cursor(doc):
+    return f"{doc['timestamp'].isoformat()}_{doc['_id']}"
+
+KEYSET_SORT = [("timestamp", -1), ("_id", -1)]
+
+def keyset_query(query, after):
+    """`query` narrowed to the rows that follow the `after` cursor."""
+    if after:
+        try:
+            timestamp, last_id = after.rsplit('_', 1)
+            timestamp, last_id = datetime.fromisoformat(timestamp), ObjectId(last_id)
+            return {"$and": [query, {"$or": [{"timestamp": {"$lt": timestamp}}, {"timestamp": timestamp, "_id": {"$lt": last_id}}]}]}
+        except (ValueError, InvalidId):
+            pass
+    return query
+
+def keyset_page(rows, page_size):
+    """Split page_size + 1 fetched rows into (rows, cursor for the next page or None)."""
+    return rows[:page_size], encode_cursor(rows[page_size - 1]) if len(rows) > page_size else None
+
+def paginate(collection, query, projection, after=None, page_size=PAGE_SIZE):
+    """One keyset page of `query`, newest first. Returns (rows, cursor for the next page or None)."""
+    return keyset_page(list(collection.find(keyset_query(query, after), projection, sort=KEYSET_SORT, limit=page_size + 1)), page_size)
+
+# === PATIENT ARCHIVE ===
+# Completed registrations older than ARCHIVE_AFTER_DAYS are moved in batches to
+# the zstd-compressed `patients_archive`, so the hot collection's working set
+# stays in RAM. Reads consult the archive only when their date range or page
+# reaches back to the newest archived registration. Archived rows are read-only.
+archive_horizon_cache = TTLCache(1, 60)
+
+def archive_horizon():
+    """Timestamp of the newest archived patient, or None when nothing is archived."""
+    cached = archive_horizon_cache.get('horizon')
+    if cached is None:
+        newest = patients_archive_collection.find_one({}, {'timestamp': 1}, sort=[('timestamp', -1)])
+        cached = (newest['timestamp'] if newest else None,)
+        archive_horizon_cache.set('horizon', cached)
+    return cached[0]
+
+def archive_needed(query, horizon):
+    timestamp = query.get('timestamp')
+    start = timestamp.get('$gte') if isinstance(timestamp, dict) else None
+    return horizon is not None and (start is None or start <= horizon)
+
+def needs_archive(query):
+    return archive_needed(query, archive_horizon())
+
+def page_reaches_archive(query, rows, next_cursor, horizon):
+    return archive_needed(query, horizon) and not (next_cursor and rows[-1]['timestamp'] > horizon)
+
+def merge_archive_page(page, archived_page, page_size):
+    """Merge a hot and an archived keyset page into one (rows, next cursor)."""
+    (rows, next_cursor), (archived, archived_cursor) = page, archived_page
+    merged = sorted(rows + archived, key=lambda p: (p['timestamp'], p['_id']), reverse=True)
+    more = len(merged) > page_size or next_cursor or archived_cursor
+    return merged[:page_size], encode_cursor(merged[page_size - 1]) if more and len(merged) >= page_size else None
+
+def paginate_patients(query, projection, after=None, page_size=PAGE_SIZE):
+    """`paginate` over patients, merged with the archive once the page reaches archived time."""
+    page = paginate(patients_collection, query, projection, after, page_size)
+    if not page_reaches_archive(query, *page, archive_horizon()): return page
+    return merge_archive_page(page, paginate(patients_archive_collection, query, projection, after, page_size), page_size)
+
+def count_patients(query, limit=None):
+    """Matching patients, hot and archived; with `limit`, counting stops once that many are found."""
+    count = patients_collection.count_documents(query, **({'limit': limit} if limit else {}))
+    if needs_archive(query) and not (limit and count >= limit):
+        count += patients_archive_collection.count_documents(query, **({'limit': limit - count} if limit else {}))
+    return count
+
+def ensure_archive_collection():
+    if 'patients_archive' not in db.list_collection_names():
+        try: db.create_collection('patients_archive', storageEngine={'wiredTiger': {'configString': 'block_compressor=zstd'}})
+        except CollectionInvalid: pass
+
+def archive_patients(older_than_days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move completed patients past the retention window to the archive. Safe to interrupt and re-run.
+
+    Each batch is copied, then deleted from `patients` only if unchanged since
+    it was read; copies of rows that changed meanwhile are dropped again.
+    """
+    ensure_archive_collection()
+    cutoff, moved = datetime.utcnow() - timedelta(days=older_than_days), 0
+    query = {'status': 'Complete', 'timestamp': {'$lt': cutoff}, 'photo_status': {'$exists': False}}
+    while True:
+        batch = list(patients_collection.find(query, sort=[('timestamp', 1)], limit=batch_size))
+        if not batch: break
+        try: patients_archive_collection.insert_many(batch, ordered=False)
+        except BulkWriteError as e:
+            if any(error['code'] != 11000 for error in e.details['writeErrors']): raise
+        ids = [p['_id'] for p in batch]
+        patients_collection.bulk_write([DeleteOne({'_id': p['_id'], 'updated_at': p.get('updated_at')}) for p in batch], ordered=False)
+        kept = [p['_id'] for p in patients_collection.find({'_id': {'$in': ids}}, {'_id': 1})]
+        if kept: patients_archive_collection.delete_many({'_id': {'$in': kept}})
+        moved += len(ids) - len(kept)
+    archive_horizon_cache.invalidate('horizon')
+    return moved
+
+# === PATIENT SEARCH ===
+# Patients carry normalised copies of name and phone written at insert time so
+# center search is an index-backed prefix/exact lookup, never a user regex.
+def search_fields(name, phone):
+    return {'name_tokens': re.findall(r'\w+', (name or '').lower()), 'phone_digits': re.sub(r'\D', '', phone or '')}
+
+def search_filter(search_query):
+    """Digits-only input matches a phone prefix; anything else matches name-token prefixes."""
+    if not re.search(r'[^\d\s+()-]', search_query):
+        digits = re.sub(r'\D', '', search_query)
+        return {'phone_digits': {'$regex': '^' + digits}} if digits else {}
+    tokens = search_fields(search_query, '')['name_tokens']
+    return {'$and': [{'name_tokens': {'$regex': '^' + re.escape(token)}} for token in tokens]} if tokens else {}
+
+def backfill_search_fields(batch_size=1000):
+    updated, batch = 0, []
+    for patient in patients_collection.find({'name_tokens': {'$exists': False}}, {'name': 1, 'phone': 1}):
+        batch.append(UpdateOne({'_id': patient['_id']}, {'$set': search_fields(patient.get('name'), patient.get('phone'))}))
+        if len(batch) == batch_size:
+            updated += patients_collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch: updated += patients_collection.bulk_write(batch, ordered=False).modified_count
+    return updated
+
+# === PATIENT WRITE BUFFER ===
+# Optional group commit for registration bursts (PATIENT_WRITE_BUFFER=1):
+# inserts from concurrent requests are collected for up to WRITE_BUFFER_FLUSH_MS
+# or WRITE_BUFFER_MAX_BATCH documents and written with one unordered
+# insert_many. Each request returns only once its own document is acknowledged.
+def insert_outcomes(count, error):
+    """Per-document exception, or None on success, for a batch written by one unordered insert_many."""
+    if error is None: return [None] * count
+    if isinstance(error, BulkWriteError) and not error.details.get('writeConcernErrors'):
+        failed = {e['index']: e for e in error.details.get('writeErrors', [])}
+        return [WriteError(failed[i]['errmsg'], failed[i]['code'], failed[i]) if i in failed else None for i in range(count)]
+    return [error] * count
+
+def record_insert_batch(size):
+    metrics.increment('patient_insert_batches_total')
+    metrics.increment('patient_insert_batch_documents_total', size)
+
+class InsertBuffer:
+    """Funnels inserts from request threads through one flusher thread."""
+
+    def __init__(self, collection, max_batch=WRITE_BUFFER_MAX_BATCH, flush_seconds=WRITE_BUFFER_FLUSH_MS / 1000):
+        self.collection, self.max_batch, self.flush_seconds = collection, max_batch, flush_seconds
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.run, name='patient-insert-buffer', daemon=True)
+        self.thread.start()
+
+    def insert(self, document):
+        """Queue `document` and block until its batch is written; raises that document's write error.
+
+        Gives up with TimeoutError after WRITE_BUFFER_TIMEOUT_SECONDS; the
+        document may still be written, which the submission key makes safe to retry.
+        """
+        if not self.thread.is_alive(): raise RuntimeError("Patient write buffer is not running.")
+        future = Future()
+        self.queue.put((document, future))
+        future.result(timeout=WRITE_BUFFER_TIMEOUT_SECONDS)
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None: return
+            batch, deadline = [item], time.monotonic() + self.flush_seconds
+            while len(batch) < self.max_batch:
+                try: item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty: break
+                if item is None:
+                    self.flush(batch)
+                    return
+                batch.append(item)
+            self.flush(batch)
+
+    def flush(self, batch):
+        """Write `batch` and resolve every future in it, whatever fails; the flusher thread must not die."""
+        try:
+            error = None
+            try: self.collection.insert_many([document for document, _ in batch], ordered=False)
+            except Exception as e: error = e
+            record_insert_batch(len(batch))
+            outcomes = insert_outcomes(len(batch), error)
+        except Exception as e:
+            logger.exception("Patient write buffer failed to settle a batch of %d", len(batch))
+            outcomes = [e] * len(batch)
+        for (_, future), outcome in zip(batch, outcomes):
+            if outcome: future.set_exception(outcome)
+            else: future.set_result(None)
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join(timeout=10)
+
+patient_writes = ProcessLocal(lambda: InsertBuffer(patients_collection), close=lambda buffer: buffer.close())
+
+def insert_patient(patient):
+    if PATIENT_WRITE_BUFFER: patient_writes.insert(patient)
+    else: patients_collection.insert_one(patient)
+
+# === PHOTO UPLOADS ===
+# Registration spools raw photos to GridFS and returns; a bounded thread pool
+# uploads them with retries and patches the URLs onto the patient. Patients
+# show a "processing" placeholder until `photo_status` is cleared.
+upload_executor = ProcessLocal(lambda: ThreadPoolExecutor(max_workers=UPLOAD_CONCURRENCY, thread_name_prefix='photo-upload'),
+                               close=lambda pool: pool.shutdown(wait=True, cancel_futures=True))
+
+def upload_photo(data, filename):
+    """Send one image to the configured backend and return its public URL."""
+    with timed('photo_upload_duration_seconds', backend=UPLOAD_BACKEND):
+        if UPLOAD_BACKEND == 'local':
+            name = f"{ObjectId()}{os.path.splitext(filename)[1].lower()}"
+            os.makedirs(LOCAL_UPLOAD_DIR, exist_ok=True)
+            with open(os.path.join(LOCAL_UPLOAD_DIR, name), 'wb') as f:
+                f.write(data)
+            return f"{HOST_URL}/uploads/{name}"
+        return cloudinary.uploader.upload(io.BytesIO(data)).get('secure_url')
+
+def upload_with_retries(data, filename):
+    for attempt in range(UPLOAD_MAX_ATTEMPTS):
+        try:
+            return upload_photo(data, filename)
+        except Exception as e:
+            if attempt == UPLOAD_MAX_ATTEMPTS - 1: raise
+            delay = UPLOAD_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+            logger.warning("Photo upload failed (%s); retrying in %.1fs.", e, delay)
+            time.sleep(delay)
+
+def prepare_photo(data, filename):
+    """Auto-orient, downscale and recompress a photo and cut a thumbnail.
+
+    Returns [(bytes, filename)] for the full image and its thumbnail; without
+    Pillow (or for unreadable images) the original is used for both.
+    """
+    if Image is None: return [(data, filename)] * 2
+    try:
+        image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    except Exception:
+        return [(data, filename)] * 2
+    fmt = 'WEBP' if features.check('webp') else 'JPEG'
+    if fmt == 'JPEG' or image.mode not in ('RGB', 'RGBA'): image = image.convert('RGB')
+    variants = []
+    for dimension in (PHOTO_MAX_DIMENSION, PHOTO_THUMB_DIMENSION):
+        variant = image.copy()
+        variant.thumbnail((dimension, dimension))
+        buffered = io.BytesIO()
+        variant.save(buffered, fmt, quality=PHOTO_QUALITY, optimize=True)
+        variants.append((buffered.getvalue(), f"{os.path.splitext(filename)[0]}.{fmt.lower()}"))
+    return variants
+
+class HashingReader:
+    """Read-through wrapper that hashes and counts a stream while GridFS spools it."""
+    def __init__(self, stream): self.stream, self.digest, self.size = stream, hashlib.sha256(), 0
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.digest.update(chunk)
+        self.size += len(chunk)
+        return chunk
+
+def spool_photos(files):
+    """Store the submitted photos in GridFS; returns the pending upload jobs for the patient."""
+    pending = []
+    for form_field, url_field in (('photo1', 'photo_url_1'), ('photo2', 'photo_url_2')):
+        upload = files.get(form_field)
+        if upload and upload.filename != '':
+            reader = HashingReader(upload.stream)
+            file_id = photo_spool.upload_from_stream(upload.filename, reader, metadata={'content_type': upload.mimetype})
+            pending.append({'field': url_field, 'file_id': file_id, 'filename': upload.filename, 'sha256': reader.digest.hexdigest(), 'size': reader.size})
+    return pending
+
+# Uploaded photos are remembered in `photo_blobs` by the SHA-256 of the
+# submitted bytes, so the same prescription or ID photo sent again (retries,
+# repeat visits) reuses the stored URLs instead of being processed and uploaded.
+def photo_blob_hit(job, blob):
+    """URLs for `job` from a stored blob, counting the hit or miss."""
+    if not blob:
+        if job.get('sha256'): metrics.increment('photo_dedup_misses_total')
+        return None
+    metrics.increment('photo_dedup_hits_total')
+    metrics.increment('photo_dedup_bytes_saved_total', blob.get('bytes', 0))
+    return {job['field']: blob['url'], thumb_url_field(job): blob['thumb_url']}
+
+def photo_blob_update(job, urls, uploaded_bytes):
+    return UpdateOne({'_id': job['sha256']}, {'$setOnInsert': {
+        'url': urls[job['field']], 'thumb_url': urls[thumb_url_field(job)], 'bytes': uploaded_bytes, 'created_at': datetime.utcnow()}}, upsert=True)
+
+def upload_photo_variants(job, data):
+    """Process and upload one spooled photo; returns (urls, bytes uploaded)."""
+    (full, full_name), (thumb, thumb_name) = prepare_photo(data, job['filename'])
+    urls = {job['field']: upload_with_retries(full, full_name)}
+    urls[thumb_url_field(job)] = upload_with_retries(thumb, thumb_name) if thumb is not full else urls[job['field']]
+    return urls, len(full) + (len(thumb) if thumb is not full else 0)
+
+def process_patient_photos(patient_id):
+    """Upload a patient's spooled photos and patch in their URLs; safe to re-run."""
+    patient = patients_collection.find_one({'_id': patient_id}, {'pending_photos': 1, 'timestamp': 1, 'center_id': 1, 'medical_id': 1})
+    if not patient: return
+    failed = False
+    for job in patient.get('pending_photos', []):
+        try:
+            urls = photo_blob_hit(job, job.get('sha256') and photo_blobs_collection.find_one({'_id': job['sha256']}))
+            if urls is None:
+                urls, uploaded_bytes = upload_photo_variants(job, photo_spool.open_download_stream(job['file_id']).read())
+                if job.get('sha256'): photo_blobs_collection.bulk_write([photo_blob_update(job, urls, uploaded_bytes)])
+        except Exception:
+            logger.exception("Giving up on photo upload for patient %s.", patient_id)
+            failed = True
+            continue
+        patients_collection.update_one({'_id': patient_id}, photo_uploaded_update(job, urls))
+        rollup_patch_recent(patient, urls)
+        photo_spool.delete(job['file_id'])
+    patients_collection.update_one({'_id': patient_id}, photos_finished_update(failed))
+    rollup_patch_recent(patient, {'photo_status': 'failed' if failed else None})
+
+def thumb_url_field(job):
+    return job['field'].replace('photo_url', 'photo_thumb_url')
+
+def photo_uploaded_update(job, urls):
+    return {'$set': {**urls, 'updated_at': datetime.utcnow()}, '$pull': {'pending_photos': {'file_id': job['file_id']}}}
+
+def photos_finished_update(failed):
+    if failed: return {'$set': {'photo_status': 'failed', 'updated_at': datetime.utcnow()}}
+    return {'$unset': {'photo_status': '', 'pending_photos': ''}, '$set': {'updated_at': datetime.utcnow()}}
+
+def drain_photo_uploads():
+    """Re-run uploads left behind by a crashed worker or exhausted retries."""
+    patient_ids = [p['_id'] for p in patients_collection.find({'photo_status': {'$in': ['processing', 'failed']}}, {'_id': 1})]
+    list(upload_executor.map(process_patient_photos, patient_ids))
+    return len(patient_ids)
+
+# === DAILY REGISTRATION ROLLUP ===
+# One document per (date, center_id, medical_id) with counters and the most
+# recent patients, kept current at write time so the admin dashboard is a
+# single indexed read. `flask rebuild-daily-registrations` regenerates it.
+PATIENT_STATUSES = ['Pending', 'Running', 'Complete']
+ROLLUP_PATIENT_FIELDS = ['name', 'phone', 'ultrasound_name', 'status', 'center_visibility', 'photo_url_1', 'photo_url_2',
+                         'photo_thumb_url_1', 'photo_thumb_url_2', 'photo_status', 'timestamp']
+
+def rollup_key(patient):
+    return {'date': patient['timestamp'].strftime('%Y-%m-%d'), 'center_id': patient['center_id'], 'medical_id': patient['medical_id']}
+
+def rollup_registration_update(patient):
+    summary = {'_id': patient['_id'], **{field: patient.get(field) for field in ROLLUP_PATIENT_FIELDS}}
+    return UpdateOne(rollup_key(patient), {
+        '$inc': {'count': 1, f"statuses.{patient['status']}": 1, f"visibility.{patient['center_visibility']}": 1},
+        '$push': {'recent': {'$each': [summary], '$sort': {'timestamp': -1}, '$slice': ROLLUP_RECENT_LIMIT}},
+        '$set': {'updated_at': datetime.utcnow()}
+    }, upsert=True)
+
+def rollup_record_registration(patient):
+    daily_registrations_collection.bulk_write([rollup_registration_update(patient)])
+
+def rollup_recent_patch(patient, changes):
+    return UpdateOne({**rollup_key(patient), 'recent._id': patient['_id']},
+                     {'$set': {'updated_at': datetime.utcnow(), **{f"recent.$.{field}": value for field, value in changes.items()}}})
+
+def rollup_patch_recent(patient, changes):
+    daily_registrations_collection.bulk_write([rollup_recent_patch(patient, changes)])
+
+def rollup_record_changes(patients, field, new_value):
+    """Move patients between status/visibility buckets and patch their recent entries."""
+    bucket = {'status': 'statuses', 'center_visibility': 'visibility'}[field]
+    moves = {}
+    for patient in patients:
+        key = rollup_key(patient)
+        group = (key['date'], key['center_id'], key['medical_id'], patient.get(field))
+        moves[group] = moves.get(group, 0) + 1
+    operations = [UpdateOne({'date': date, 'center_id': center_id, 'medical_id': medical_id},
+                            {'$inc': {f"{bucket}.{old_value}": -count, f"{bucket}.{new_value}": count}, '$set': {'updated_at': datetime.utcnow()}})
+                  for (date, center_id, medical_id, old_value), count in moves.items()]
+    operations += [UpdateOne({**rollup_key(p), 'recent._id': p['_id']}, {'$set': {f"recent.$.{field}": new_value}}) for p in patients]
+    if operations: daily_registrations_collection.bulk_write(operations, ordered=False)
+
+def change_patients(scope, patient_ids, field, new_value):
+    """Set `field` on the given patients that fall within `scope` (the ownership filter).
+
+    Reads the affected patients once, writes one UpdateMany per previous value in a
+    single bulk_write and returns (modified count, affected patients).
+    """
+    ids = [ObjectId(pid) for pid in patient_ids if ObjectId.is_valid(pid)]
+    if not ids: return 0, []
+    patients = list(patients_collection.find({**scope, '_id': {'$in': ids}, field: {'$ne': new_value}},
+                                             {'name': 1, field: 1, 'timestamp': 1, 'center_id': 1, 'medical_id': 1}))
+    if not patients: return 0, []
+    by_old_value = {}
+    for patient in patients: by_old_value.setdefault(patient.get(field), []).append(patient['_id'])
+    result = patients_collection.bulk_write([
+        UpdateMany({**scope, '_id': {'$in': group_ids}, field: old_value}, {'$set': {field: new_value, 'updated_at': datetime.utcnow()}})
+        for old_value, group_ids in by_old_value.items()], ordered=False)
+    rollup_record_changes(patients, field, new_value)
+    return result.modified_count, patients
+
+def bulk_action_response(modified, message, fallback):
+    if request.accept_mimetypes.best == 'application/json': return jsonify({'modified': modified})
+    flash(message, "success" if modified else "warning")
+    return redirect(request.referrer or fallback)
+
+def rebuild_daily_registrations():
+    """Regenerate the rollup from patients (hot and archived). Writes made while it runs are replaced by the $out."""
+    bucket_counts = lambda field, values: {value: {"$sum": {"$cond": [{"$eq": [f"${field}", value]}, 1, 0]}} for value in values}
+    statuses, visibility = bucket_counts('status', PATIENT_STATUSES), bucket_counts('center_visibility', ['hidden', 'visible'])
+    patients_collection.aggregate([
+        {"$unionWith": "patients_archive"},
+        {"$sort": {"timestamp": -1}},
+        {"$group": {
+            "_id": {"date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}, "center_id": "$center_id", "medical_id": "$medical_id"},
+            "count": {"$sum": 1},
+            **{f"status_{k}": v for k, v in statuses.items()}, **{f"visibility_{k}": v for k, v in visibility.items()},
+            "recent": {"$push": {"_id": "$_id", **{field: f"${field}" for field in ROLLUP_PATIENT_FIELDS}}}
+        }},
+        {"$project": {
+            "_id": 0, "date": "$_id.date", "center_id": "$_id.center_id", "medical_id": "$_id.medical_id", "count": 1,
+            "statuses": {k: f"$status_{k}" for k in statuses}, "visibility": {k: f"$visibility_{k}" for k in visibility},
+            "recent": {"$slice": ["$recent", ROLLUP_RECENT_LIMIT]}
+        }},
+        {"$out": "daily_registrations"}
+    ], allowDiskUse=True)
+
+# === DASHBOARD VERSIONS ===
+# A dashboard's version is its latest change time plus a row count, read from
+# indexes. A matching If-None-Match is answered with 304 before any heavy
+# query or render runs.
+TEMPLATES_VERSION = hashlib.sha256("".join([*TEMPLATE_SOURCES.values(), *ASSET_NAMES.values()]).encode('utf-8')).hexdigest()[:12]
+
+def dashboard_version(role, reads=None):
+    """(version token, last modified) for the logged-in role's dashboard as selected by the query string.
+
+    The admin rollup is read from a secondary; pass the causally consistent
+    session the page itself reads with, so the page is never older than its version.
+    """
+    if role == 'admin':
+        filter_date = request.args.get('filter_date', datetime.now().strftime('%Y-%m-%d'))
+        rollups = stale_reads(daily_registrations_collection)
+        latest = rollups.find_one({'date': filter_date}, {'updated_at': 1}, sort=[('updated_at', -1)], session=reads)
+        count = rollups.count_documents({'date': filter_date}, session=reads)
+        count = f"{count}.{centers_collection.estimated_document_count()}.{medicals_collection.estimated_document_count()}"
+    else:
+        latest = patients_collection.find_one(dashboard_scope(role, session), {'updated_at': 1}, sort=[('updated_at', -1)])
+        counter = analytics_counters_collection.find_one({'_id': dashboard_counter_id(role, session)}, {'count': 1})
+        count = counter['count'] if counter else 0
+    return version_token(role, session, request.query_string, latest, count, dashboard_day(role, request.args, session))
+
+def dashboard_scope(role, session):
+    if role == 'center': return {'center_id': ObjectId(session['center_id']), 'center_visibility': 'visible'}
+    return {'medical_id': ObjectId(session['owner_id'])}
+
+def dashboard_counter_id(role, session):
+    """The analytics counter bumped by every registration in a dashboard's scope.
+
+    Together with the newest updated_at it changes whenever the dashboard
+    can, at the cost of two indexed point reads instead of counting history.
+    """
+    return f"center:{session['center_id']}" if role == 'center' else f"medical:{session['owner_id']}"
+
+def dashboard_day(role, args, session):
+    """The date a center dashboard shows, after defaulting to today; a bare URL must not revalidate across midnight."""
+    return center_dashboard_query(args, session['center_id'])[1] if role == 'center' else ''
+
+def version_token(role, session, query_string, latest, count, day=''):
+    last_modified = latest.get('updated_at') if latest else None
+    identity = session.get('center_id') or session.get('owner_id') or 'admin'
+    raw = f"{TEMPLATES_VERSION}|{role}|{identity}|{query_string.decode()}|{day}|{last_modified}|{count}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()[:32], last_modified
+
+def not_modified(version):
+    """A 304 when the client already has this version; pending flash messages always re-render."""
+    if '_flashes' in session or not request.if_none_match.contains_weak(version[0]): return None
+    return versioned(Response(status=304), version)
+
+def versioned(response, version):
+    response = make_response(response)
+    response.set_etag(version[0])
+    if version[1]: response.last_modified = version[1]
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+# === ANALYTICS COUNTERS ===
+# Running totals per center, per medical and per day, bumped with $inc at
+# write time. `flask reconcile-analytics` corrects any drift from patients.
+def analytics_registration_updates(patient):
+    date = patient['timestamp'].strftime('%Y-%m-%d')
+    return [
+        UpdateOne({'_id': f"center:{patient['center_id']}"}, {'$inc': {'count': 1}, '$setOnInsert': {'kind': 'center', 'ref': patient['center_id']}}, upsert=True),
+        UpdateOne({'_id': f"medical:{patient['medical_id']}"}, {'$inc': {'count': 1}, '$setOnInsert': {'kind': 'medical', 'ref': patient['medical_id']}}, upsert=True),
+        UpdateOne({'_id': f"day:{date}"}, {'$inc': {'count': 1}, '$setOnInsert': {'kind': 'day', 'ref': date}}, upsert=True),
+    ]
+
+def analytics_record_registration(patient):
+    analytics_counters_collection.bulk_write(analytics_registration_updates(patient), ordered=False)
+
+def analytics_daily_series(start_date, end_date):
+    days = stale_reads(analytics_counters_collection).find({'kind': 'day', 'ref': {'$gte': start_date, '$lte': end_date}}, {'ref': 1, 'count': 1}, sort=[('ref', 1)])
+    return [(d['ref'], d['count']) for d in days]
+
+def analytics_top(kind, limit=5, start_date=None, end_date=None):
+    """Top centers or medicals by registrations, all time or within a date range."""
+    if start_date:
+        field = f"{kind}_id"
+        ranked = stale_reads(daily_registrations_collection).aggregate([
+            {"$match": {"date": {"$gte": start_date, "$lte": end_date}}},
+            {"$group": {"_id": f"${field}", "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1}}, {"$limit": limit}
+        ])
+        ranked = [(r['_id'], r['count']) for r in ranked]
+    else:
+        ranked = [(c['ref'], c['count']) for c in stale_reads(analytics_counters_collection).find({'kind': kind}, {'ref': 1, 'count': 1}, sort=[('count', -1)], limit=limit)]
+    collection = stale_reads(centers_collection if kind == 'center' else medicals_collection)
+    names = {d['_id']: d['name'] for d in collection.find({'_id': {'$in': [ref for ref, _ in ranked]}}, {'name': 1})}
+    return [(names[ref], count) for ref, count in ranked if ref in names]
+
+def reconcile_analytics():
+    """Recount every counter from patients (hot and archived) and fix the ones that drifted.
+
+    A registration landing between the recount and the fix can be overwritten;
+    the next run corrects it.
+    """
+    sources = {
+        'center': [{"$group": {"_id": "$center_id", "count": {"$sum": 1}}}],
+        'medical': [{"$group": {"_id": "$medical_id", "count": {"$sum": 1}}}],
+        'day': [{"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}, "count": {"$sum": 1}}}],
+    }
+    expected = {}
+    for kind, pipeline in sources.items():
+        for row in patients_collection.aggregate([{"$unionWith": "patients_archive"}] + pipeline, allowDiskUse=True):
+            expected[f"{kind}:{row['_id']}"] = (kind, row['_id'], row['count'])
+    current = {c['_id']: c['count'] for c in analytics_counters_collection.find({}, {'count': 1})}
+    fixes = [UpdateOne({'_id': key}, {'$set': {'count': count, 'kind': kind, 'ref': ref}}, upsert=True)
+             for key, (kind, ref, count) in expected.items() if current.get(key) != count]
+    stale = [key for key in current if key not in expected]
+    if fixes: analytics_counters_collection.bulk_write(fixes, ordered=False)
+    if stale: analytics_counters_collection.delete_many({'_id': {'$in': stale}})
+    return len(fixes) + len(stale)
 
 # ##############################################################################
 # ## 3. SUPER ADMIN ROUTES
 # ##############################################################################
-@app.route('/')
+@route('/')
 def index():
     if 'logged_in' in session: return redirect(url_for('admin_dashboard'))
     if 'center_id' in session: return redirect(url_for('center_dashboard'))
     if 'owner_id' in session: return redirect(url_for('owner_dashboard'))
     return redirect(url_for('login'))
 
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST' and request.form.get('username') == ADMIN_USER and request.form.get('password') == ADMIN_PASSWORD:
         session['logged_in'] = True
         return redirect(url_for('admin_dashboard'))
-    return render_page("Super Admin Login", LOGIN_TEMPLATE)
+    return render_page("Super Admin Login", 'login')
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     session.pop('logged_in', None)
     return redirect(url_for('login'))
 
-@app.route('/admin')
+@route('/admin')
 def admin_dashboard():
     if 'logged_in' not in session: return redirect(url_for('login'))
+    with client.start_session(causal_consistency=True) as reads:
+        return admin_dashboard_page(reads)
+
+def admin_dashboard_page(reads):
+    version = dashboard_version('admin', reads)
+    cached = not_modified(version)
+    if cached: return cached
     
     filter_date_str = request.args.get('filter_date', datetime.now().strftime('%Y-%m-%d'))
-    try: start_of_day = datetime.strptime(filter_date_str, '%Y-%m-%d')
-    except ValueError:
-        filter_date_str = datetime.now().strftime('%Y-%m-%d')
-        start_of_day = datetime.strptime(filter_date_str, '%Y-%m-%d')
-    end_of_day = start_of_day + timedelta(days=1)
+    try: datetime.strptime(filter_date_str, '%Y-%m-%d')
+    except ValueError: filter_date_str = datetime.now().strftime('%Y-%m-%d')
 
-    all_centers = list(centers_collection.find({}, sort=[('name', 1)]))
-    pipeline = [
-        {"$sort": {"name": 1}},
-        {"$lookup": {"from": "medicals", "localField": "_id", "foreignField": "center_id", "as": "medicals"}},
-        {"$unwind": {"path": "$medicals", "preserveNullAndEmptyArrays": True}},
-        {"$lookup": {
-            "from": "patients", "let": {"medical_id": "$medicals._id"},
-            "pipeline": [
-                {"$match": {"$expr": {"$eq": ["$medical_id", "$$medical_id"]}, "timestamp": {"$gte": start_of_day, "$lt": end_of_day}}},
-                {"$sort": {"timestamp": -1}}
-            ], "as": "medicals.patients"
-        }},
-        {"$group": {
-            "_id": "$medicals._id", "center_id": {"$first": "$_id"}, "center_name": {"$first": "$name"},
-            "center_address": {"$first": "$address"}, "medical_name": {"$first": "$medicals.name"},
-            "medical_username": {"$first": "$medicals.username"},
-            "qr_code": {"$first": "$medicals.qr_code"}, "patients": {"$first": "$medicals.patients"}
-        }},
-        {"$group": {
-            "_id": "$center_id", "name": {"$first": "$center_name"}, "address": {"$first": "$center_address"},
-            "medicals": {"$push": {
-                "_id": "$_id", "name": "$medical_name", "username": "$medical_username", 
-                "qr_code": "$qr_code", "patients": "$patients"
-            }}
-        }},
-        {"$project": {
-            "name": 1, "address": 1, "medicals": {"$filter": {"input": "$medicals", "as": "m", "cond": {"$ne": ["$$m._id", None]}}}
-        }},
-        {"$sort": {"name": 1}}
-    ]
-    centers_with_data = list(centers_collection.aggregate(pipeline))
-    
-    return render_page("Super Admin Dashboard", ADMIN_TEMPLATE, centers=all_centers, centers_with_medicals=centers_with_data, filter_date=filter_date_str)
+    all_centers = list(centers_collection.find({}, {'name': 1, 'address': 1, 'username': 1}, sort=[('name', 1)]))
+    rollups = {r['medical_id']: r for r in stale_reads(daily_registrations_collection).find({'date': filter_date_str}, {'medical_id': 1, 'count': 1, 'recent': 1}, session=reads)}
+    medicals_by_center = {}
+    for medical in medicals_collection.find({}, {'name': 1, 'username': 1, 'center_id': 1}):
+        rollup = rollups.get(medical['_id'], {})
+        medical['count'], medical['patients'] = rollup.get('count', 0), rollup.get('recent', [])
+        medicals_by_center.setdefault(medical['center_id'], []).append(medical)
+    centers_with_data = [{**center, 'medicals': medicals_by_center.get(center['_id'], [])} for center in all_centers]
+
+    return versioned(render_page("Super Admin Dashboard", 'admin', centers=all_centers, centers_with_medicals=centers_with_data, filter_date=filter_date_str), version)
 
-@app.route('/add-center', methods=['POST'])
+@cli.command('rebuild-daily-registrations')
+def rebuild_daily_registrations_command():
+    """Regenerate the daily_registrations rollup from the patients collection."""
+    rebuild_daily_registrations()
+    click.echo(f"Rebuilt {daily_registrations_collection.estimated_document_count()} daily registration rollups.")
+
+@cli.command('archive-patients')
+@click.option('--days', default=ARCHIVE_AFTER_DAYS, show_default=True, help="Archive completed patients registered more than this many days ago.")
+@click.option('--batch-size', default=ARCHIVE_BATCH_SIZE, show_default=True)
+def archive_patients_command(days, batch_size):
+    """Move old completed patients from patients to patients_archive."""
+    click.echo(f"Archived {archive_patients(days, batch_size)} patients.")
+
+@route('/add-center', methods=['POST'])
 def add_center():
     if 'logged_in' not in session: return redirect(url_for('login'))
     form = request.form
     if centers_collection.find_one({"username": form['username']}):
         flash(f"Username '{form['username']}' already exists.", "danger")
     else:
-        centers_collection.insert_one({
+        new_center = centers_collection.insert_one({
             "name": form['name'], "address": form['address'], "username": form['username'],
             "password": generate_password_hash(form['password'])
         })
+        registration_cache.invalidate_where(lambda context: context[1] and context[1]['_id'] == new_center.inserted_id)
         flash(f"Center '{form['name']}' created.", "success")
     return redirect(url_for('admin_dashboard'))
 
-@app.route('/reset-center-password/<center_id>', methods=['POST'])
+@route('/reset-center-password/<center_id>', methods=['POST'])
 def reset_center_password(center_id):
     if 'logged_in' not in session: return redirect(url_for('login'))
     hashed_password = generate_password_hash(request.form.get('new_password'))
     centers_collection.update_one({"_id": ObjectId(center_id)}, {"$set": {"password": hashed_password}})
+    registration_cache.invalidate_where(lambda context: context[1] and context[1]['_id'] == ObjectId(center_id))
     flash("Center password has been reset.", "success")
     return redirect(url_for('admin_dashboard'))
 
-@app.route('/add-medical', methods=['POST'])
+@route('/add-medical', methods=['POST'])
 def add_medical():
     if 'logged_in' not in session: return redirect(url_for('login'))
     form = request.form
@@ -499,27 +1725,78 @@ def add_medical():
     if name and center_id_str and username and password:
         new_medical = medicals_collection.insert_one({
             'name': name, 'center_id': ObjectId(center_id_str),
-            'username': username, 'password': generate_password_hash(password),
-            'qr_code': ''
+            'username': username, 'password': generate_password_hash(password)
         })
-        registration_url = f"{HOST_URL}/register/{new_medical.inserted_id}"
-        qr_code_b64 = generate_qr_code_base64(registration_url)
-        medicals_collection.update_one({'_id': new_medical.inserted_id}, {'$set': {'qr_code': qr_code_b64}})
+        registration_cache.invalidate(str(new_medical.inserted_id))
         flash(f"Medical staff '{name}' added with username '{username}'.", "success")
     return redirect(url_for('admin_dashboard'))
 
-@app.route('/reset-medical-password/<medical_id>', methods=['POST'])
+@route('/bulk-add-medicals', methods=['POST'])
+def bulk_add_medicals():
+    if 'logged_in' not in session: return redirect(url_for('login'))
+    upload = request.files.get('csv_file')
+    if not upload or upload.filename == '':
+        flash("Choose a CSV file to upload.", "danger")
+        return redirect(url_for('admin_dashboard'))
+    rows = csv.DictReader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig'))
+    created, failures = provision_medicals(rows, request.form.get('center_id') or None)
+    for medical in created: registration_cache.invalidate(str(medical['_id']))
+    flash(f"Bulk upload: {len(created)} QR owners created, {len(failures)} rows failed.", "success" if not failures else "warning")
+    if request.form.get('output') == 'sheet':
+        return render_qr_sheet(created, failures)
+    return send_file(build_qr_zip(created, failures), mimetype='application/zip', as_attachment=True,
+                     download_name=f"qr-owners-{datetime.now().strftime('%Y%m%d-%H%M%S')}.zip")
+
+@cli.command('bulk-add-medicals')
+@click.argument('csv_path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--center-id', default=None, help="Center for rows without a center_id column.")
+@click.option('--out', 'out_path', required=True, type=click.Path(dir_okay=False), help="Write a .zip of QR files or an .html print sheet.")
+def bulk_add_medicals_command(csv_path, center_id, out_path):
+    """Create QR owners from a CSV of name, username, password[, center_id]."""
+    with open(csv_path, newline='', encoding='utf-8-sig') as f:
+        created, failures = provision_medicals(csv.DictReader(f), center_id)
+    if out_path.endswith('.html'):
+        with current_app.test_request_context():
+            content = render_qr_sheet(created, failures).encode('utf-8')
+    else:
+        content = build_qr_zip(created, failures).getvalue()
+    with open(out_path, 'wb') as f:
+        f.write(content)
+    for failure in failures:
+        click.echo(f"Row {failure['row']} ({failure['username'] or 'no username'}): {failure['reason']}", err=True)
+    click.echo(f"Created {len(created)} QR owners, {len(failures)} rows failed. Wrote {out_path}.")
+
+@route('/reset-medical-password/<medical_id>', methods=['POST'])
 def reset_medical_password(medical_id):
     if 'logged_in' not in session: return redirect(url_for('login'))
     hashed_password = generate_password_hash(request.form.get('new_password'))
     medicals_collection.update_one({"_id": ObjectId(medical_id)}, {"$set": {"password": hashed_password}})
+    registration_cache.invalidate(medical_id)
     flash("QR Owner password has been reset.", "success")
     return redirect(url_for('admin_dashboard'))
 
+@route('/qr/<medical_id>.<any(png, svg):fmt>')
+def medical_qr(medical_id, fmt):
+    # Only medicals that exist get a QR, so arbitrary ids cannot fill medical_qr_image's cache.
+    if not ObjectId.is_valid(medical_id) or not get_registration_context(medical_id): return "Invalid QR code.", 404
+    image, etag = medical_qr_image(medical_id, fmt)
+    response = Response(image, mimetype='image/svg+xml' if fmt == 'svg' else 'image/png')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = 31536000
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+@cli.command('drop-qr-blobs')
+def drop_qr_blobs():
+    """Remove the base64 QR images stored on medicals; they are now served from /qr/."""
+    result = medicals_collection.update_many({'qr_code': {'$exists': True}}, {'$unset': {'qr_code': ''}})
+    click.echo(f"Dropped stored QR codes from {result.modified_count} medicals.")
+
 # ##############################################################################
 # ## 4. QR OWNER ROUTES (NEW)
 # ##############################################################################
-@app.route('/owner-login', methods=['GET', 'POST'])
+@route('/owner-login', methods=['GET', 'POST'])
 def owner_login():
     if request.method == 'POST':
         owner = medicals_collection.find_one({"username": request.form['username']})
@@ -527,43 +1804,46 @@ def owner_login():
             session['owner_id'], session['owner_name'] = str(owner['_id']), owner['name']
             return redirect(url_for('owner_dashboard'))
         flash("Invalid QR Owner username or password.", "danger")
-    return render_page("QR Owner Login", OWNER_LOGIN_TEMPLATE)
+    return render_page("QR Owner Login", 'owner_login')
 
-@app.route('/owner-logout')
+@route('/owner-logout')
 def owner_logout():
     session.pop('owner_id', None)
     session.pop('owner_name', None)
     return redirect(url_for('owner_login'))
 
-@app.route('/owner-dashboard')
+@route('/owner-dashboard')
 def owner_dashboard():
     if 'owner_id' not in session: return redirect(url_for('owner_login'))
+    version = dashboard_version('owner')
+    cached = not_modified(version)
+    if cached: return cached
     
     # MODIFIED: Query now fetches ALL patients for this owner, not just the hidden ones.
     query = {"medical_id": ObjectId(session['owner_id'])}
-    patients = list(patients_collection.find(query, sort=[("timestamp", -1)]))
-    return render_page(f"{session['owner_name']} Dashboard", OWNER_DASHBOARD_TEMPLATE, patients=patients)
+    after, per_page = request.args.get('after'), page_size_arg()
+    patients, next_cursor = paginate_patients(query, OWNER_DASHBOARD_FIELDS, after, per_page)
+    return versioned(render_page(f"{session['owner_name']} Dashboard", 'owner_dashboard', patients=patients,
+                                 after=after, next_cursor=next_cursor, per_page=per_page), version)
 
-@app.route('/send-to-center/<patient_id>', methods=['POST'])
+@route('/send-to-center/<patient_id>', methods=['POST'])
 def send_to_center(patient_id):
     if 'owner_id' not in session: return redirect(url_for('owner_login'))
     
-    patient = patients_collection.find_one({
-        "_id": ObjectId(patient_id), 
-        "medical_id": ObjectId(session['owner_id'])
-    })
-    if patient:
-        patients_collection.update_one(
-            {"_id": ObjectId(patient_id)}, 
-            {"$set": {"center_visibility": "visible"}}
-        )
-        flash(f"Patient '{patient.get('name')}' sent to the center.", "success")
-    return redirect(url_for('owner_dashboard'))
+    modified, patients = change_patients({"medical_id": ObjectId(session['owner_id'])}, [patient_id], 'center_visibility', 'visible')
+    if modified: flash(f"Patient '{patients[0].get('name')}' sent to the center.", "success")
+    return redirect(request.referrer or url_for('owner_dashboard'))
+
+@route('/bulk-send-to-center', methods=['POST'])
+def bulk_send_to_center():
+    if 'owner_id' not in session: return redirect(url_for('owner_login'))
+    modified, _ = change_patients({"medical_id": ObjectId(session['owner_id'])}, request.form.getlist('patient_ids'), 'center_visibility', 'visible')
+    return bulk_action_response(modified, f"{modified} patients sent to the center.", url_for('owner_dashboard'))
 
 # ##############################################################################
 # ## 5. CENTER ADMIN ROUTES
 # ##############################################################################
-@app.route('/center-login', methods=['GET', 'POST'])
+@route('/center-login', methods=['GET', 'POST'])
 def center_login():
     if request.method == 'POST':
         center = centers_collection.find_one({"username": request.form['username']})
@@ -571,110 +1851,523 @@ def center_login():
             session['center_id'], session['center_name'] = str(center['_id']), center['name']
             return redirect(url_for('center_dashboard'))
         flash("Invalid center username or password.", "danger")
-    return render_page("Center Login", CENTER_LOGIN_TEMPLATE)
+    return render_page("Center Login", 'center_login')
 
-@app.route('/center-logout')
+@route('/center-logout')
 def center_logout():
     session.pop('center_id', None)
     session.pop('center_name', None)
     return redirect(url_for('center_login'))
 
-@app.route('/center-dashboard')
+@route('/center-dashboard')
 def center_dashboard():
     if 'center_id' not in session: return redirect(url_for('center_login'))
-    filter_date_str = request.args.get('filter_date', datetime.now().strftime('%Y-%m-%d'))
-    search_query = request.args.get('search_query', '')
-    start_of_day = datetime.strptime(filter_date_str, '%Y-%m-%d')
+    version = dashboard_version('center')
+    cached = not_modified(version)
+    if cached: return cached
+    query, filter_date_str, search_query, all_dates = center_dashboard_query(request.args, session['center_id'])
+    after, per_page = request.args.get('after'), page_size_arg()
+    changes_since = datetime.utcnow().isoformat()
+    patients, next_cursor = paginate_patients(query, CENTER_DASHBOARD_FIELDS, after, per_page)
+    count_limit = ALL_DATES_COUNT_LIMIT if all_dates else None
+    total = count_patients(query, count_limit)
+    return versioned(render_page(f"{session['center_name']} Dashboard", 'center_dashboard', patients=patients, total=total,
+                                 total_capped=bool(count_limit) and total >= count_limit, filter_date=filter_date_str,
+                                 search_query=search_query, all_dates=all_dates, after=after, next_cursor=next_cursor, per_page=per_page,
+                                 live_updates=LIVE_UPDATES, live_prepend=not (after or search_query or all_dates),
+                                 changes_since=changes_since, poll_interval_ms=POLL_INTERVAL_MS), version)
+
+def center_dashboard_query(args, center_id):
+    """(query, filter date, search text, all dates?) for the center dashboard's query string."""
+    filter_date_str = args.get('filter_date', datetime.now().strftime('%Y-%m-%d'))
+    search_query = args.get('search_query', '').strip()
+    all_dates = args.get('all_dates') == '1'
+    try: start_of_day = datetime.strptime(filter_date_str, '%Y-%m-%d')
+    except ValueError:
+        filter_date_str = datetime.now().strftime('%Y-%m-%d')
+        start_of_day = datetime.strptime(filter_date_str, '%Y-%m-%d')
     end_of_day = start_of_day + timedelta(days=1)
     
     query = {
-        "center_id": ObjectId(session['center_id']), 
-        "timestamp": {"$gte": start_of_day, "$lt": end_of_day},
+        "center_id": ObjectId(center_id), 
         "center_visibility": "visible" # <-- Important: Only shows patients sent by the owner
     }
-    if search_query:
-        query["$or"] = [
-            {"name": {"$regex": search_query, "$options": "i"}},
-            {"phone": {"$regex": search_query, "$options": "i"}}
-        ]
-    patients = list(patients_collection.find(query, sort=[("timestamp", -1)]))
-    return render_page(f"{session['center_name']} Dashboard", CENTER_DASHBOARD_TEMPLATE, patients=patients, filter_date=filter_date_str, search_query=search_query)
-
-@app.route('/update-patient-status/<patient_id>', methods=['POST'])
+    if not all_dates: query["timestamp"] = {"$gte": start_of_day, "$lt": end_of_day}
+    if search_query: query.update(search_filter(search_query))
+    return query, filter_date_str, search_query, all_dates
+
+def center_day_range():
+    try: start_of_day = datetime.strptime(request.args.get('filter_date', ''), '%Y-%m-%d')
+    except ValueError: start_of_day = datetime.strptime(datetime.now().strftime('%Y-%m-%d'), '%Y-%m-%d')
+    return start_of_day, start_of_day + timedelta(days=1)
+
+live_stream_slots = threading.BoundedSemaphore(MAX_LIVE_STREAMS)
+
+def center_row_event(patient):
+    return {'id': str(patient['_id']), 'html': render_template('center_patient_row', p=patient)}
+
+def changes_cursor_query(since):
+    """Rows changed after a polling cursor: "<updated_at>_<_id>" of the last row seen, or a bare timestamp."""
+    timestamp, _, last_id = since.partition('_')
+    try: timestamp = datetime.fromisoformat(timestamp)
+    except ValueError: return {"updated_at": {"$gt": datetime.utcnow()}}
+    try: last_id = ObjectId(last_id)
+    except (InvalidId, TypeError): return {"updated_at": {"$gt": timestamp}}
+    return {"$or": [{"updated_at": {"$gt": timestamp}}, {"updated_at": timestamp, "_id": {"$gt": last_id}}]}
+
+@route('/center-dashboard/stream')
+def center_stream():
+    """Server-Sent Events for rows of this center's day that are inserted or changed."""
+    if 'center_id' not in session: return "Not logged in.", 401
+    start_of_day, end_of_day = center_day_range()
+    pipeline = [
+        {"$match": {"operationType": {"$in": ["insert", "update", "replace"]}, "fullDocument.center_id": ObjectId(session['center_id']),
+                    "fullDocument.center_visibility": "visible", "fullDocument.timestamp": {"$gte": start_of_day, "$lt": end_of_day}}},
+        {"$project": {"operationType": 1, "fullDocument._id": 1, **{f"fullDocument.{field}": 1 for field in CENTER_DASHBOARD_FIELDS}}},
+    ]
+    resume_after = {'_data': request.headers['Last-Event-ID']} if request.headers.get('Last-Event-ID') else None
+
+    def events():
+        if not live_stream_slots.acquire(blocking=False):
+            yield "event: unsupported\ndata: {}\n\n"  # at MAX_LIVE_STREAMS; this page polls instead
+            return
+        try:
+            with stream_patients.watch(pipeline, full_document='updateLookup', resume_after=resume_after,
+                                           max_await_time_ms=SSE_HEARTBEAT_SECONDS * 1000) as stream:
+                yield "retry: 5000\n\n"
+                while stream.alive:
+                    change = stream.try_next()
+                    if change is None:
+                        yield ": keepalive\n\n"
+                        continue
+                    yield f"id: {stream.resume_token['_data']}\ndata: {json.dumps(center_row_event(change['fullDocument']))}\n\n"
+        except OperationFailure:
+            # Change streams need a replica set; the page falls back to polling.
+            yield "event: unsupported\ndata: {}\n\n"
+        except Exception:
+            logger.exception("Center change stream failed; falling back to polling")
+            yield "event: unsupported\ndata: {}\n\n"
+        finally:
+            live_stream_slots.release()
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@route('/center-dashboard/changes')
+def center_changes():
+    """Polling fallback: rows of this center's day changed after `since`, oldest change first.
+
+    Pages on (updated_at, _id) so a bulk update stamping many rows with the
+    same updated_at is delivered across polls instead of cut at the limit.
+    """
+    if 'center_id' not in session: return jsonify({'error': 'Not logged in.'}), 401
+    start_of_day, end_of_day = center_day_range()
+    since = request.args.get('since', '')
+    changed = list(patients_collection.find(
+        {"$and": [{"center_id": ObjectId(session['center_id']), "center_visibility": "visible",
+                   "timestamp": {"$gte": start_of_day, "$lt": end_of_day}}, changes_cursor_query(since)]},
+        {**CENTER_DASHBOARD_FIELDS, 'updated_at': 1}, sort=[("updated_at", 1), ("_id", 1)], limit=MAX_PAGE_SIZE))
+    if changed: since = f"{changed[-1]['updated_at'].isoformat()}_{changed[-1]['_id']}"
+    return jsonify({'rows': [center_row_event(p) for p in changed], 'since': since, 'more': len(changed) == MAX_PAGE_SIZE})
+
+@cli.command('backfill-search-fields')
+def backfill_search_fields_command():
+    """Add normalised name tokens and phone digits to patients registered before search indexing."""
+    click.echo(f"Backfilled search fields on {backfill_search_fields()} patients.")
+
+@route('/update-patient-status/<patient_id>', methods=['POST'])
 def update_patient_status(patient_id):
     if 'center_id' not in session: return redirect(url_for('center_login'))
     new_status = request.form.get('new_status')
-    patient = patients_collection.find_one({"_id": ObjectId(patient_id), "center_id": ObjectId(session['center_id'])})
-    if patient and new_status in ['Pending', 'Running', 'Complete']:
-        patients_collection.update_one({"_id": ObjectId(patient_id)}, {"$set": {"status": new_status}})
-        flash(f"Status updated to {new_status}.", "success")
+    if new_status in PATIENT_STATUSES:
+        modified, _ = change_patients({"center_id": ObjectId(session['center_id']), "center_visibility": "visible"}, [patient_id], 'status', new_status)
+        if modified: flash(f"Status updated to {new_status}.", "success")
     return redirect(request.referrer or url_for('center_dashboard'))
 
+@route('/bulk-update-patient-status', methods=['POST'])
+def bulk_update_patient_status():
+    if 'center_id' not in session: return redirect(url_for('center_login'))
+    new_status = request.form.get('new_status')
+    if new_status not in PATIENT_STATUSES: return bulk_action_response(0, "Choose a valid status.", url_for('center_dashboard'))
+    modified, _ = change_patients({"center_id": ObjectId(session['center_id']), "center_visibility": "visible"},
+                                  request.form.getlist('patient_ids'), 'status', new_status)
+    return bulk_action_response(modified, f"{modified} patients marked {new_status}.", url_for('center_dashboard'))
+
 # ##############################################################################
 # ## 6. DATA EXPORT & ANALYTICS ROUTES
 # ##############################################################################
-@app.route('/analytics')
+@route('/analytics')
 def analytics_dashboard():
     if 'logged_in' not in session: return redirect(url_for('login'))
-    thirty_days_ago = datetime.now() - timedelta(days=30)
-    daily_pipeline = [
-        {"$match": {"timestamp": {"$gte": thirty_days_ago}}},
-        {"$group": {"_id": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}, "count": {"$sum": 1}}},
-        {"$sort": {"_id": 1}}
-    ]
-    daily_data = list(patients_collection.aggregate(daily_pipeline))
-    daily_stats = {'labels': [d['_id'] for d in daily_data], 'data': [d['count'] for d in daily_data]}
-    top_centers_pipeline = [
-        {"$group": {"_id": "$center_id", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}, {"$limit": 5},
-        {"$lookup": {"from": "centers", "localField": "_id", "foreignField": "_id", "as": "center_info"}},
-        {"$unwind": "$center_info"}
-    ]
-    top_centers_data = list(patients_collection.aggregate(top_centers_pipeline))
-    top_centers = {'labels': [c['center_info']['name'] for c in top_centers_data], 'data': [c['count'] for c in top_centers_data]}
-    top_medicals_pipeline = [
-        {"$group": {"_id": "$medical_id", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}}, {"$limit": 5},
-        {"$lookup": {"from": "medicals", "localField": "_id", "foreignField": "_id", "as": "medical_info"}},
-        {"$unwind": "$medical_info"}
-    ]
-    top_medicals_data = list(patients_collection.aggregate(top_medicals_pipeline))
-    top_medicals = {'labels': [m['medical_info']['name'] for m in top_medicals_data], 'data': [m['count'] for m in top_medicals_data]}
-    return render_page("Analytics", ANALYTICS_TEMPLATE, daily_stats=daily_stats, top_centers=top_centers, top_medicals=top_medicals)
+    today = datetime.utcnow().strftime('%Y-%m-%d')
+    start_date, end_date = request.args.get('start', ''), request.args.get('end', '') or today
+    try:
+        datetime.strptime(end_date, '%Y-%m-%d')
+        if start_date: datetime.strptime(start_date, '%Y-%m-%d')
+    except ValueError:
+        start_date, end_date = '', today
+    ranged = bool(start_date)
+    if not ranged: start_date = (datetime.utcnow() - timedelta(days=30)).strftime('%Y-%m-%d')
+    daily_data = analytics_daily_series(start_date, end_date)
+    daily_stats = {'labels': [d for d, _ in daily_data], 'data': [c for _, c in daily_data]}
+    top_centers_data = analytics_top('center', 5, *((start_date, end_date) if ranged else ()))
+    top_centers = {'labels': [name for name, _ in top_centers_data], 'data': [count for _, count in top_centers_data]}
+    top_medicals_data = analytics_top('medical', 5, *((start_date, end_date) if ranged else ()))
+    top_medicals = {'labels': [name for name, _ in top_medicals_data], 'data': [count for _, count in top_medicals_data]}
+    return render_page("Analytics", 'analytics', daily_stats=daily_stats, top_centers=top_centers, top_medicals=top_medicals,
+                       start=start_date, end=end_date, ranged=ranged)
+
+@cli.command('reconcile-analytics')
+@click.option('--interval', default=0, type=int, help="Keep running, reconciling every INTERVAL seconds.")
+def reconcile_analytics_command(interval):
+    """Correct analytics counters that drifted from the patients collection."""
+    while True:
+        click.echo(f"Corrected {reconcile_analytics()} analytics counters.")
+        if interval <= 0: break
+        time.sleep(interval)
+
+# === STREAMING EXPORTS ===
+# Exports stream a projected, batched cursor through a generator, so worker
+# memory stays constant however many rows match.
+EXPORT_FIELDS = ['_id', 'name', 'phone', 'ultrasound_name', 'status', 'center_visibility', 'timestamp',
+                 'center_id', 'medical_id', 'photo_url_1', 'photo_url_2']
+
+def export_query(base_query):
+    """Add the start/end (inclusive, YYYY-MM-DD) and status filters from the query string."""
+    query = dict(base_query)
+    try:
+        timestamp = {}
+        if request.args.get('start'): timestamp['$gte'] = datetime.strptime(request.args['start'], '%Y-%m-%d')
+        if request.args.get('end'): timestamp['$lt'] = datetime.strptime(request.args['end'], '%Y-%m-%d') + timedelta(days=1)
+        if timestamp: query['timestamp'] = timestamp
+    except ValueError:
+        pass
+    if request.args.get('status') in PATIENT_STATUSES: query['status'] = request.args['status']
+    return query
+
+CSV_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+def csv_cell(value):
+    """Patient-typed text as a CSV cell that spreadsheets show as text instead of running it as a formula."""
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES): return "'" + value
+    return value
+
+def export_chunks(query, fmt):
+    collections = [patients_collection] + ([patients_archive_collection] if needs_archive(query) else [])
+    cursors = [stale_reads(c).find(query, {field: 1 for field in EXPORT_FIELDS}, sort=[('timestamp', 1)], batch_size=EXPORT_BATCH_SIZE) for c in collections]
+    try:
+        buffered = io.StringIO()
+        writer = csv.writer(buffered)
+        if fmt == 'csv': writer.writerow(EXPORT_FIELDS)
+        for count, patient in enumerate(heapq.merge(*cursors, key=lambda p: p['timestamp']), start=1):
+            if fmt == 'csv':
+                writer.writerow([patient['timestamp'].isoformat() if field == 'timestamp' and patient.get(field) else csv_cell(patient.get(field, '')) for field in EXPORT_FIELDS])
+            else:
+                buffered.write(json.dumps({field: patient.get(field) for field in EXPORT_FIELDS}, default=str) + "\n")
+            if count % EXPORT_BATCH_SIZE == 0:
+                yield buffered.getvalue().encode('utf-8')
+                buffered.seek(0)
+                buffered.truncate()
+        yield buffered.getvalue().encode('utf-8')
+    finally:
+        for cursor in cursors: cursor.close()
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed: yield compressed
+    yield compressor.flush()
+
+def export_response(base_query, name):
+    fmt = 'ndjson' if request.args.get('format') == 'ndjson' else 'csv'
+    chunks = export_chunks(export_query(base_query), fmt)
+    filename = f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{fmt}"
+    mimetype = 'application/x-ndjson' if fmt == 'ndjson' else 'text/csv'
+    if request.args.get('gzip') == '1':
+        chunks, filename, mimetype = gzip_chunks(chunks), filename + '.gz', 'application/gzip'
+    return Response(chunks, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"', 'X-Accel-Buffering': 'no', 'Cache-Control': 'no-store'})
+
+@route('/admin/export')
+def admin_export():
+    if 'logged_in' not in session: return redirect(url_for('login'))
+    return export_response({}, "registrations")
+
+@route('/center-dashboard/export')
+def center_export():
+    if 'center_id' not in session: return redirect(url_for('center_login'))
+    return export_response({"center_id": ObjectId(session['center_id']), "center_visibility": "visible"}, "center-registrations")
+
+@route('/owner-dashboard/export')
+def owner_export():
+    if 'owner_id' not in session: return redirect(url_for('owner_login'))
+    return export_response({"medical_id": ObjectId(session['owner_id'])}, "owner-registrations")
+
+@route('/api/dashboard-version')
+def dashboard_version_api():
+    """The current dashboard's version token, for clients that poll before re-fetching the page."""
+    role = 'admin' if 'logged_in' in session else 'center' if 'center_id' in session else 'owner' if 'owner_id' in session else None
+    if not role: return jsonify({'error': 'Not logged in.'}), 401
+    token, last_modified = dashboard_version(role)
+    return jsonify({'dashboard': role, 'version': token, 'last_modified': last_modified.isoformat() if last_modified else None})
+
+@route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape target. Each worker process reports its own series."""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f"Bearer {METRICS_TOKEN}" and 'logged_in' not in session:
+        return Response("Unauthorized\n", 401, mimetype='text/plain')
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 # ##############################################################################
 # ## 7. PATIENT REGISTRATION ROUTES
 # ##############################################################################
-@app.route('/register/<medical_id>', methods=['GET', 'POST'])
+def new_patient(form, medical_id, medical, pending_photos):
+    now = datetime.utcnow()
+    key = submission_key(form)
+    return {
+        'name': form['name'], 'phone': form['phone'], 'ultrasound_name': form['ultrasound_name'],
+        'medical_id': ObjectId(medical_id), 'center_id': medical['center_id'], 
+        'timestamp': now, 'updated_at': now, 'status': 'Pending',
+        'center_visibility': 'hidden', # <-- Important: Data is hidden from center by default
+        'photo_url_1': '', 'photo_url_2': '',
+        **({'photo_status': 'processing', 'pending_photos': pending_photos} if pending_photos else {}),
+        **({'submission_key': key} if key else {}),
+        **search_fields(form['name'], form['phone'])
+    }
+
+@route('/register/<medical_id>', methods=['GET', 'POST'])
 def register_patient(medical_id):
     try:
-        medical = medicals_collection.find_one({'_id': ObjectId(medical_id)})
-        if not medical: return "<h2>Invalid registration link.</h2>", 404
-        center = centers_collection.find_one({'_id': medical['center_id']})
+        context = get_registration_context(medical_id)
+        if not context: return "<h2>Invalid registration link.</h2>", 404
+        medical, center = context
         if request.method == 'POST':
-            photo1_url, photo2_url = '', ''
-            if 'photo1' in request.files and request.files['photo1'].filename != '':
-                photo1_url = cloudinary.uploader.upload(request.files['photo1']).get('secure_url')
-            if 'photo2' in request.files and request.files['photo2'].filename != '':
-                photo2_url = cloudinary.uploader.upload(request.files['photo2']).get('secure_url')
-            patients_collection.insert_one({
-                'name': request.form['name'], 'phone': request.form['phone'], 'ultrasound_name': request.form['ultrasound_name'],
-                'medical_id': ObjectId(medical_id), 'center_id': medical['center_id'], 
-                'timestamp': datetime.utcnow(), 'status': 'Pending',
-                'center_visibility': 'hidden', # <-- Important: Data is hidden from center by default
-                'photo_url_1': photo1_url, 'photo_url_2': photo2_url
-            })
+            key = submission_key(request.form)
+            if previous_submission(key): return redirect(url_for('registration_success'))
+            pending_photos = spool_photos(request.files)
+            patient = new_patient(request.form, medical_id, medical, pending_photos)
+            try: insert_patient(patient)
+            except WriteError as e:
+                if not is_duplicate_key(e) or not key: raise
+                for job in pending_photos: photo_spool.delete(job['file_id'])  # a concurrent retry of the same form won
+                return redirect(url_for('registration_success'))
+            if key: recent_submissions.set(key, patient['_id'])
+            rollup_record_registration(patient)
+            analytics_record_registration(patient)
+            if pending_photos: upload_executor.submit(process_patient_photos, patient['_id'])
             return redirect(url_for('registration_success'))
-        return render_template_string(REGISTER_TEMPLATE, medical=medical, center=center)
+        return render_template('register', medical=medical, center=center, submission_key=new_submission_key())
     except Exception as e:
         return f"<h2>An error occurred: {e}</h2>", 400
 
-@app.route('/success')
+@route('/success')
 def registration_success():
-    return render_template_string(SUCCESS_TEMPLATE)
+    return render_template('success')
+
+@route('/uploads/<path:filename>')
+def local_upload(filename):
+    if UPLOAD_BACKEND != 'local': return "Not found.", 404
+    return send_from_directory(LOCAL_UPLOAD_DIR, filename)
+
+@route('/assets/<filename>')
+def static_asset(filename):
+    if filename not in ASSETS: return "Not found.", 404
+    mimetype, bodies = ASSETS[filename]
+    encoding = preferred_encoding(request.accept_encodings)
+    response = Response(bodies[encoding or 'identity'], mimetype=mimetype)
+    if encoding: response.content_encoding = encoding
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = ASSET_MAX_AGE
+    response.cache_control.immutable = True
+    return response
+
+@cli.command('drain-photo-uploads')
+def drain_photo_uploads_command():
+    """Upload any spooled patient photos still marked processing or failed."""
+    click.echo(f"Processed photo uploads for {drain_photo_uploads()} patients.")
+
+# ##############################################################################
+# ## 8. DATABASE INDEXES
+# ##############################################################################
+# Every index the routes rely on is declared here. ensure_indexes() is
+# idempotent: create_indexes is a no-op for indexes that already exist.
+INDEXES = {
+    'centers': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True, sparse=True),
+    ],
+    'medicals': [
+        IndexModel([('username', ASCENDING)], name='username_unique', unique=True, sparse=True),
+    ],
+    'patients': [
+        IndexModel([('center_id', ASCENDING), ('center_visibility', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], name='center_visible_timestamp_id'),
+        IndexModel([('center_id', ASCENDING), ('center_visibility', ASCENDING), ('name_tokens', ASCENDING), ('timestamp', DESCENDING)], name='center_visible_name_tokens'),
+        IndexModel([('center_id', ASCENDING), ('center_visibility', ASCENDING), ('phone_digits', ASCENDING), ('timestamp', DESCENDING)], name='center_visible_phone_digits'),
+        IndexModel([('center_id', ASCENDING), ('center_visibility', ASCENDING), ('updated_at', ASCENDING), ('_id', ASCENDING)], name='center_visible_updated_at_id'),
+        IndexModel([('medical_id', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], name='medical_timestamp_id'),
+        IndexModel([('medical_id', ASCENDING), ('updated_at', DESCENDING)], name='medical_updated_at'),
+        IndexModel([('timestamp', DESCENDING)], name='timestamp'),
+        IndexModel([('photo_status', ASCENDING)], name='photo_status_pending', sparse=True),
+        IndexModel([('submission_key', ASCENDING)], name='submission_key_unique', unique=True, sparse=True),
+    ],
+    'patients_archive': [
+        IndexModel([('center_id', ASCENDING), ('center_visibility', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], name='center_visible_timestamp_id'),
+        IndexModel([('center_id', ASCENDING), ('center_visibility', ASCENDING), ('name_tokens', ASCENDING), ('timestamp', DESCENDING)], name='center_visible_name_tokens'),
+        IndexModel([('center_id', ASCENDING), ('center_visibility', ASCENDING), ('phone_digits', ASCENDING), ('timestamp', DESCENDING)], name='center_visible_phone_digits'),
+        IndexModel([('medical_id', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], name='medical_timestamp_id'),
+        IndexModel([('timestamp', DESCENDING)], name='timestamp'),
+    ],
+    'analytics_counters': [
+        IndexModel([('kind', ASCENDING), ('count', DESCENDING)], name='kind_count'),
+        IndexModel([('kind', ASCENDING), ('ref', ASCENDING)], name='kind_ref'),
+    ],
+    'daily_registrations': [
+        IndexModel([('date', ASCENDING), ('center_id', ASCENDING), ('medical_id', ASCENDING)], name='date_center_medical', unique=True),
+    ],
+}
+
+def ensure_indexes():
+    ensure_archive_collection()
+    for collection_name, indexes in INDEXES.items():
+        created = db[collection_name].create_indexes(indexes)
+        logger.info("Indexes on %s: %s", collection_name, ", ".join(created))
+
+def index_checks():
+    """Representative (label, explain output) pairs for each query a route issues."""
+    probe_id, now = ObjectId(), datetime.utcnow()
+    day = {"$gte": now - timedelta(days=1), "$lt": now}
+    yield "login: centers.username", centers_collection.find({"username": ""}).explain()
+    yield "owner_login: medicals.username", medicals_collection.find({"username": ""}).explain()
+    yield "register_patient: submission key", patients_collection.find({"submission_key": ""}, {"_id": 1}).explain()
+    yield "admin_dashboard: daily rollup", daily_registrations_collection.find({"date": now.strftime('%Y-%m-%d')}).explain()
+    yield "owner_dashboard: patients by medical", patients_collection.find(
+        {"medical_id": probe_id}, sort=[("timestamp", -1), ("_id", -1)]).explain()
+    yield "center_dashboard: visible patients by day", patients_collection.find(
+        {"center_id": probe_id, "timestamp": day, "center_visibility": "visible"}, sort=[("timestamp", -1), ("_id", -1)]).explain()
+    yield "center_dashboard: name search", patients_collection.find(
+        {"center_id": probe_id, "center_visibility": "visible", **search_filter("ravi")}, sort=[("timestamp", -1), ("_id", -1)]).explain()
+    yield "center_dashboard: phone search", patients_collection.find(
+        {"center_id": probe_id, "center_visibility": "visible", **search_filter("98765")}, sort=[("timestamp", -1), ("_id", -1)]).explain()
+    yield "center_dashboard: changes since", patients_collection.find(
+        {"center_id": probe_id, "center_visibility": "visible", "updated_at": {"$gt": now}, "timestamp": day}, sort=[("updated_at", 1), ("_id", 1)]).explain()
+    yield "owner_dashboard: archived patients by medical", patients_archive_collection.find(
+        {"medical_id": probe_id}, sort=[("timestamp", -1), ("_id", -1)]).explain()
+    yield "center_dashboard: archived patients by day", patients_archive_collection.find(
+        {"center_id": probe_id, "timestamp": day, "center_visibility": "visible"}, sort=[("timestamp", -1), ("_id", -1)]).explain()
+    yield "owner_dashboard: version", patients_collection.find({"medical_id": probe_id}, sort=[("updated_at", -1)], limit=1).explain()
+    yield "center_dashboard: version", patients_collection.find(
+        {"center_id": probe_id, "center_visibility": "visible"}, sort=[("updated_at", -1)], limit=1).explain()
+    yield "analytics_dashboard: daily counters", analytics_counters_collection.find(
+        {"kind": "day", "ref": {"$gte": "", "$lte": now.strftime('%Y-%m-%d')}}, sort=[("ref", 1)]).explain()
+    yield "analytics_dashboard: top counters", analytics_counters_collection.find(
+        {"kind": "center"}, sort=[("count", -1)], limit=5).explain()
+    yield "analytics_dashboard: ranged top", db.command(
+        'aggregate', 'daily_registrations', pipeline=[{"$match": {"date": {"$gte": "", "$lte": now.strftime('%Y-%m-%d')}}}], explain=True)
+
+def plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan: yield plan['stage']
+        for value in plan.values(): yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan: yield from plan_stages(value)
+
+def verify_indexes(strict=False):
+    """Explain every route query and report the ones that fall back to a COLLSCAN."""
+    scans = []
+    for label, explain in index_checks():
+        stages = set(plan_stages(explain.get('queryPlanner', explain)))
+        if 'COLLSCAN' in stages:
+            scans.append(label)
+            logger.warning("Query '%s' is not covered by an index (COLLSCAN).", label)
+    if scans and strict:
+        raise RuntimeError(f"Queries falling back to COLLSCAN: {', '.join(scans)}")
+    return scans
+
+@cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Create the declared indexes and verify the route queries use them."""
+    ensure_indexes()
+    scans = verify_indexes()
+    click.echo("All route queries are index-backed." if not scans else f"COLLSCAN: {', '.join(scans)}")
+
+@cli.command('verify-indexes')
+@click.option('--strict/--no-strict', default=True, help="Exit non-zero when any route query falls back to COLLSCAN.")
+def verify_indexes_command(strict):
+    """Explain each route query and report COLLSCAN fallbacks."""
+    try: scans = verify_indexes(strict=strict)
+    except RuntimeError as e: raise click.ClickException(str(e))
+    click.echo("All route queries are index-backed." if not scans else f"COLLSCAN: {', '.join(scans)}")
+
+def read_routing_checks():
+    """(label, expected role, cursor) for one representative read per routing path."""
+    yield "admin_dashboard: daily rollup", 'secondary', stale_reads(daily_registrations_collection).find({}, {'_id': 1}, limit=1)
+    yield "analytics_dashboard: counters", 'secondary', stale_reads(analytics_counters_collection).find({}, {'_id': 1}, limit=1)
+    yield "exports: patients", 'secondary', stale_reads(patients_collection).find({}, {'_id': 1}, limit=1)
+    yield "admin_dashboard: centers (read-your-own-write)", 'primary', centers_collection.find({}, {'_id': 1}, limit=1)
+    yield "center_dashboard: patients (read-your-own-write)", 'primary', patients_collection.find({}, {'_id': 1}, limit=1)
+
+@cli.command('check-read-routing')
+def check_read_routing_command():
+    """Run one read per routing path and report which replica set member served it.
+
+    Try it against a local three-node replica set, e.g.:
+    for p in 27017 27018 27019; do mongod --replSet rs0 --port $p --dbpath /tmp/rs$p --fork --logpath /tmp/rs$p.log; done;
+    mongosh --eval 'rs.initiate({_id:"rs0",members:[{_id:0,host:"localhost:27017"},{_id:1,host:"localhost:27018"},{_id:2,host:"localhost:27019"}]})';
+    MONGO_URI='mongodb://localhost:27017,localhost:27018,localhost:27019/qr?replicaSet=rs0' flask check-read-routing
+    """
+    client.admin.command('ping')
+    secondaries, misrouted = client.secondaries, []
+    for label, expected, cursor in read_routing_checks():
+        list(cursor)
+        served_by = 'primary' if cursor.address == client.primary else 'secondary' if cursor.address in secondaries else 'standalone'
+        if secondaries and READ_ROUTING != 'primary' and served_by != expected: misrouted.append(label)
+        click.echo(f"{label}: {cursor.address[0]}:{cursor.address[1]} ({served_by})")
+    if not secondaries: click.echo("No secondaries visible; every read goes to the primary.")
+    if misrouted: raise click.ClickException(f"Misrouted reads: {', '.join(misrouted)}")
 
 # ##############################################################################
-# ## 8. RUN APP
+# ## 9. RUN APP
 # ##############################################################################
+def shutdown():
+    """Flush buffered inserts, finish in-flight photo uploads (queued ones stay spooled for `drain-photo-uploads`) and close this process's client."""
+    patient_writes.reset()
+    upload_executor.reset()
+    for proxy in ProcessLocal.instances: proxy.reset()
+
+def create_app(config=None):
+    """Build the Flask app from the environment plus `config` overrides. No connections are opened here."""
+    app = Flask(__name__)
+    app.config.from_mapping(default_config())
+    app.config.update(config or {})
+    cloudinary.config(cloud_name=app.config['CLOUDINARY_CLOUD_NAME'], api_key=app.config['CLOUDINARY_API_KEY'], api_secret=app.config['CLOUDINARY_API_SECRET'])
+    settings = {'host': app.config['MONGO_URI'], **mongo_client_options(app.config)}
+    if settings != mongo_settings:
+        shutdown()
+        mongo_settings.clear(); mongo_settings.update(settings)
+
+    app.jinja_loader = ChoiceLoader([DictLoader(TEMPLATE_SOURCES), app.jinja_loader])
+    app.jinja_env.autoescape = True  # registry names have no .html suffix, so Flask's per-extension default would leave them unescaped
+    app.jinja_env.globals['asset_url'] = asset_url
+    precompile_templates(app)
+    app.before_request(start_request_timer)
+    app.after_request(record_request_metrics)
+    app.after_request(compress_response)  # runs first, so request durations include compression
+    for rule, view, options in ROUTES: app.add_url_rule(rule, view_func=view, **options)
+    for command in cli.commands.values(): app.cli.add_command(command)
+    return app
+
+def __getattr__(name):
+    """Module-level `app` for `gunicorn app:app` and `from app import app`, built on first access so `import app` stays cheap."""
+    if name != 'app': raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    global app
+    app = create_app()
+    return app
+
+atexit.register(shutdown)
+
 if __name__ == '__main__':
+    app = create_app()
+    if os.getenv("ENSURE_INDEXES", "1") == "1":
+        ensure_indexes()
+        verify_indexes()
     app.run(host=os.getenv("FLASK_HOST", "0.0.0.0"), port=int(os.getenv("FLASK_PORT", 5000)), debug=True)
\ No newline at end of file
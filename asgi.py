@@ -0,0 +1,386 @@
+"""Async serving mode.
+
+Patient registration and the owner/center dashboards run natively on asyncio
+(Quart, motor for MongoDB, httpx for Cloudinary uploads), so a process keeps
+thousands of registrations in flight instead of one per worker thread. Every
+other URL is passed to the WSGI app from app.py. Both halves share the secret
+key, session cookie, URL map and templates, so users cannot tell them apart.
+
+    pip install -r requirements-async.txt
+    hypercorn --workers 2 --bind 0.0.0.0:5000 'asgi:create_asgi_app()'
+
+Importing this module opens no connections; each worker connects on startup.
+"""
+import asyncio
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+
+import httpx
+from cloudinary.utils import cloudinary_api_url, sign_request
+from hypercorn.middleware import AsyncioWSGIMiddleware
+from jinja2 import DictLoader
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorGridFSBucket
+from pymongo import DESCENDING
+from pymongo.errors import WriteError
+from quart import Quart, g, make_response, redirect, render_template, request, session, url_for
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map, Rule
+
+import app as wsgi
+
+# ##############################################################################
+# ## 1. CONNECTIONS
+# ##############################################################################
+class AsyncInsertBuffer:
+    """asyncio twin of app.InsertBuffer: one insert_many per WRITE_BUFFER_FLUSH_MS or WRITE_BUFFER_MAX_BATCH documents."""
+    def __init__(self, collection):
+        self.collection, self.pending, self.timer, self.writes = collection, [], None, set()
+
+    async def insert(self, document):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((document, future))
+        if len(self.pending) >= wsgi.WRITE_BUFFER_MAX_BATCH: self.flush()
+        elif self.timer is None: self.timer = loop.call_later(wsgi.WRITE_BUFFER_FLUSH_MS / 1000, self.flush)
+        await asyncio.wait_for(future, wsgi.WRITE_BUFFER_TIMEOUT_SECONDS)
+
+    def flush(self):
+        if self.timer: self.timer.cancel()
+        batch, self.pending, self.timer = self.pending, [], None
+        if not batch: return
+        task = asyncio.get_running_loop().create_task(self.write(batch))
+        self.writes.add(task)
+        task.add_done_callback(self.writes.discard)
+
+    async def write(self, batch):
+        try:
+            error = None
+            try: await self.collection.insert_many([document for document, _ in batch], ordered=False)
+            except Exception as e: error = e
+            wsgi.record_insert_batch(len(batch))
+            outcomes = wsgi.insert_outcomes(len(batch), error)
+        except Exception as e:
+            wsgi.logger.exception("Patient write buffer failed to settle a batch of %d", len(batch))
+            outcomes = [e] * len(batch)
+        for (_, future), outcome in zip(batch, outcomes):
+            if future.done(): continue  # the request was cancelled; its document is written regardless
+            if outcome: future.set_exception(outcome)
+            else: future.set_result(None)
+
+    async def close(self):
+        self.flush()
+        if self.writes: await asyncio.wait(self.writes)
+
+class Connections:
+    """The worker's motor client, GridFS spool, insert buffer and HTTP client, opened when serving starts."""
+    def __init__(self): self.client = self.db = self.spool = self.patient_writes = self.http = None
+
+    async def open(self):
+        self.client = AsyncIOMotorClient(**wsgi.mongo_settings, event_listeners=[wsgi.command_metrics])
+        self.db = self.client.get_default_database()
+        self.spool = AsyncIOMotorGridFSBucket(self.db, bucket_name='photo_spool')
+        self.patient_writes = AsyncInsertBuffer(self.db.patients)
+        self.http = httpx.AsyncClient(timeout=httpx.Timeout(30.0, connect=5.0), limits=httpx.Limits(max_connections=wsgi.UPLOAD_CONCURRENCY * 2))
+
+    async def close(self):
+        await self.patient_writes.close()
+        await self.http.aclose()
+        self.client.close()
+
+mongo = Connections()
+upload_slots, upload_tasks = None, set()
+
+# ##############################################################################
+# ## 2. ASYNC HELPERS (mirroring the sync ones in app.py)
+# ##############################################################################
+async def registration_context(medical_id):
+    context = wsgi.registration_cache.get(medical_id)
+    if context is None:
+        medical = await mongo.db.medicals.find_one({'_id': wsgi.ObjectId(medical_id)}, {'name': 1, 'center_id': 1})
+        if not medical: return None
+        context = (medical, await mongo.db.centers.find_one({'_id': medical['center_id']}, {'name': 1, 'address': 1}))
+        wsgi.registration_cache.set(medical_id, context)
+    return context
+
+async def previous_submission(key):
+    if not key: return None
+    patient_id = wsgi.recent_submissions.get(key)
+    if patient_id is None:
+        patient = await mongo.db.patients.find_one({'submission_key': key}, {'_id': 1})
+        if not patient: return None
+        patient_id = patient['_id']
+        wsgi.recent_submissions.set(key, patient_id)
+    return patient_id
+
+async def spool_photos(files):
+    pending = []
+    for form_field, url_field in (('photo1', 'photo_url_1'), ('photo2', 'photo_url_2')):
+        upload = files.get(form_field)
+        if upload and upload.filename != '':
+            reader = wsgi.HashingReader(upload.stream)
+            file_id = await mongo.spool.upload_from_stream(upload.filename, reader, metadata={'content_type': upload.mimetype})
+            pending.append({'field': url_field, 'file_id': file_id, 'filename': upload.filename, 'sha256': reader.digest.hexdigest(), 'size': reader.size})
+    return pending
+
+async def upload_photo(data, filename):
+    if wsgi.UPLOAD_BACKEND == 'local': return await asyncio.to_thread(wsgi.upload_photo, data, filename)
+    with wsgi.timed('photo_upload_duration_seconds', backend=wsgi.UPLOAD_BACKEND):
+        params = sign_request({'timestamp': int(time.time())}, {})
+        response = await mongo.http.post(cloudinary_api_url('upload', resource_type='image'), data=params, files={'file': (filename, data)})
+        response.raise_for_status()
+        return response.json()['secure_url']
+
+async def upload_with_retries(data, filename):
+    for attempt in range(wsgi.UPLOAD_MAX_ATTEMPTS):
+        try:
+            return await upload_photo(data, filename)
+        except Exception as e:
+            if attempt == wsgi.UPLOAD_MAX_ATTEMPTS - 1: raise
+            delay = wsgi.UPLOAD_BACKOFF_SECONDS * 2 ** attempt * random.uniform(0.5, 1.5)
+            wsgi.logger.warning("Photo upload failed (%s); retrying in %.1fs.", e, delay)
+            await asyncio.sleep(delay)
+
+async def upload_photo_variants(job, data):
+    (full, full_name), (thumb, thumb_name) = await asyncio.to_thread(wsgi.prepare_photo, data, job['filename'])
+    urls = {job['field']: await upload_with_retries(full, full_name)}
+    urls[wsgi.thumb_url_field(job)] = await upload_with_retries(thumb, thumb_name) if thumb is not full else urls[job['field']]
+    return urls, len(full) + (len(thumb) if thumb is not full else 0)
+
+async def process_patient_photos(patient_id):
+    """Async twin of app.process_patient_photos; anything left unfinished is picked up by `flask drain-photo-uploads`."""
+    async with upload_slots:
+        patient = await mongo.db.patients.find_one({'_id': patient_id}, {'pending_photos': 1, 'timestamp': 1, 'center_id': 1, 'medical_id': 1})
+        if not patient: return
+        failed = False
+        for job in patient.get('pending_photos', []):
+            try:
+                urls = wsgi.photo_blob_hit(job, job.get('sha256') and await mongo.db.photo_blobs.find_one({'_id': job['sha256']}))
+                if urls is None:
+                    urls, uploaded_bytes = await upload_photo_variants(job, await (await mongo.spool.open_download_stream(job['file_id'])).read())
+                    if job.get('sha256'): await mongo.db.photo_blobs.bulk_write([wsgi.photo_blob_update(job, urls, uploaded_bytes)])
+            except Exception:
+                wsgi.logger.exception("Giving up on photo upload for patient %s.", patient_id)
+                failed = True
+                continue
+            await mongo.db.patients.update_one({'_id': patient_id}, wsgi.photo_uploaded_update(job, urls))
+            await mongo.db.daily_registrations.bulk_write([wsgi.rollup_recent_patch(patient, urls)])
+            await mongo.spool.delete(job['file_id'])
+        await mongo.db.patients.update_one({'_id': patient_id}, wsgi.photos_finished_update(failed))
+        await mongo.db.daily_registrations.bulk_write([wsgi.rollup_recent_patch(patient, {'photo_status': 'failed' if failed else None})])
+
+def start_photo_uploads(patient_id):
+    task = asyncio.get_running_loop().create_task(process_patient_photos(patient_id))
+    upload_tasks.add(task)
+    task.add_done_callback(upload_tasks.discard)
+
+async def archive_horizon():
+    cached = wsgi.archive_horizon_cache.get('horizon')
+    if cached is None:
+        newest = await mongo.db.patients_archive.find_one({}, {'timestamp': 1}, sort=[('timestamp', DESCENDING)])
+        cached = (newest['timestamp'] if newest else None,)
+        wsgi.archive_horizon_cache.set('horizon', cached)
+    return cached[0]
+
+async def paginate(collection, query, projection, after, page_size):
+    cursor = collection.find(wsgi.keyset_query(query, after), projection, sort=wsgi.KEYSET_SORT, limit=page_size + 1)
+    return wsgi.keyset_page(await cursor.to_list(page_size + 1), page_size)
+
+async def paginate_patients(query, projection, after, page_size):
+    page = await paginate(mongo.db.patients, query, projection, after, page_size)
+    if not wsgi.page_reaches_archive(query, *page, await archive_horizon()): return page
+    return wsgi.merge_archive_page(page, await paginate(mongo.db.patients_archive, query, projection, after, page_size), page_size)
+
+async def count_patients(query, limit=None):
+    count = await mongo.db.patients.count_documents(query, **({'limit': limit} if limit else {}))
+    if wsgi.archive_needed(query, await archive_horizon()) and not (limit and count >= limit):
+        count += await mongo.db.patients_archive.count_documents(query, **({'limit': limit - count} if limit else {}))
+    return count
+
+async def dashboard_version(role):
+    latest, counter = await asyncio.gather(
+        mongo.db.patients.find_one(wsgi.dashboard_scope(role, session), {'updated_at': 1}, sort=[('updated_at', DESCENDING)]),
+        mongo.db.analytics_counters.find_one({'_id': wsgi.dashboard_counter_id(role, session)}, {'count': 1}))
+    return wsgi.version_token(role, session, request.query_string, latest, counter['count'] if counter else 0,
+                              wsgi.dashboard_day(role, request.args, session))
+
+def versioned(response, version):
+    response.set_etag(version[0])
+    if version[1]: response.last_modified = version[1]
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+async def not_modified(version):
+    if '_flashes' in session or not request.if_none_match.contains_weak(version[0]): return None
+    return versioned(await make_response('', 304), version)
+
+async def render_page(title, template_name, **context):
+    return await make_response(await render_template(template_name, title=title, **context))
+
+# ##############################################################################
+# ## 3. ASYNC ROUTES
+# ##############################################################################
+async def register_patient(medical_id):
+    try:
+        context = await registration_context(medical_id)
+        if not context: return "<h2>Invalid registration link.</h2>", 404
+        medical, center = context
+        if request.method == 'POST':
+            form, files = await request.form, await request.files
+            key = wsgi.submission_key(form)
+            if await previous_submission(key): return redirect(url_for('registration_success'))
+            pending_photos = await spool_photos(files)
+            patient = wsgi.new_patient(form, medical_id, medical, pending_photos)
+            try:
+                if wsgi.PATIENT_WRITE_BUFFER: await mongo.patient_writes.insert(patient)
+                else: await mongo.db.patients.insert_one(patient)
+            except WriteError as e:
+                if not wsgi.is_duplicate_key(e) or not key: raise
+                for job in pending_photos: await mongo.spool.delete(job['file_id'])
+                return redirect(url_for('registration_success'))
+            if key: wsgi.recent_submissions.set(key, patient['_id'])
+            await mongo.db.daily_registrations.bulk_write([wsgi.rollup_registration_update(patient)])
+            await mongo.db.analytics_counters.bulk_write(wsgi.analytics_registration_updates(patient), ordered=False)
+            if pending_photos: start_photo_uploads(patient['_id'])
+            return redirect(url_for('registration_success'))
+        return await render_template('register', medical=medical, center=center, submission_key=wsgi.new_submission_key())
+    except Exception as e:
+        return f"<h2>An error occurred: {e}</h2>", 400
+
+async def registration_success():
+    return await render_template('success')
+
+async def owner_dashboard():
+    if 'owner_id' not in session: return redirect(url_for('owner_login'))
+    version = await dashboard_version('owner')
+    cached = await not_modified(version)
+    if cached: return cached
+    query = {"medical_id": wsgi.ObjectId(session['owner_id'])}
+    after, per_page = request.args.get('after'), wsgi.page_size_arg(request.args)
+    patients, next_cursor = await paginate_patients(query, wsgi.OWNER_DASHBOARD_FIELDS, after, per_page)
+    return versioned(await render_page(f"{session['owner_name']} Dashboard", 'owner_dashboard', patients=patients,
+                                       after=after, next_cursor=next_cursor, per_page=per_page), version)
+
+async def center_dashboard():
+    if 'center_id' not in session: return redirect(url_for('center_login'))
+    version = await dashboard_version('center')
+    cached = await not_modified(version)
+    if cached: return cached
+    query, filter_date_str, search_query, all_dates = wsgi.center_dashboard_query(request.args, session['center_id'])
+    after, per_page = request.args.get('after'), wsgi.page_size_arg(request.args)
+    changes_since = datetime.utcnow().isoformat()
+    count_limit = wsgi.ALL_DATES_COUNT_LIMIT if all_dates else None
+    (patients, next_cursor), total = await asyncio.gather(
+        paginate_patients(query, wsgi.CENTER_DASHBOARD_FIELDS, after, per_page), count_patients(query, count_limit))
+    return versioned(await render_page(f"{session['center_name']} Dashboard", 'center_dashboard', patients=patients, total=total,
+                                       total_capped=bool(count_limit) and total >= count_limit, filter_date=filter_date_str,
+                                       search_query=search_query, all_dates=all_dates, after=after, next_cursor=next_cursor, per_page=per_page,
+                                       live_updates=wsgi.LIVE_UPDATES, live_prepend=not (after or search_query or all_dates),
+                                       changes_since=changes_since, poll_interval_ms=wsgi.POLL_INTERVAL_MS), version)
+
+ASYNC_VIEWS = {view.__name__: view for view in (register_patient, registration_success, owner_dashboard, center_dashboard)}
+
+# WSGI endpoints that hold their thread for as long as the client stays connected.
+STREAMING_ENDPOINTS = {'center_stream', 'admin_export', 'center_export', 'owner_export'}
+
+def served_by_wsgi(**kwargs):
+    """Placeholder so url_for can build WSGI-only endpoints; the dispatcher never routes here."""
+    return "Not found.", 404
+
+# ##############################################################################
+# ## 4. APP FACTORY
+# ##############################################################################
+class ExecutorWSGIMiddleware(AsyncioWSGIMiddleware):
+    """hypercorn's asyncio WSGI adapter, running the app on its own thread pool.
+
+    The stock adapter uses the loop's default executor, which asyncio.to_thread
+    (photo processing, local uploads) shares; long-lived streams would starve it.
+    """
+    def __init__(self, wsgi_app, executor, max_body_size):
+        super().__init__(wsgi_app, max_body_size)
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+
+        def call_soon(func, *args):
+            return asyncio.run_coroutine_threadsafe(func(*args), loop).result()
+
+        await self.wsgi_app(scope, receive, send, partial(loop.run_in_executor, self.executor), call_soon)
+
+class Dispatcher:
+    """ASGI entry: requests matching an async route go to Quart, everything else to the WSGI app.
+
+    WSGI requests run on WSGI_THREADS threads; SSE and streamed exports get a
+    separate WSGI_STREAM_THREADS pool, so open dashboards cannot starve other routes.
+    """
+    def __init__(self, quart_app, flask_app):
+        self.quart_app = quart_app
+        # hypercorn buffers WSGI request bodies and answers a bare 400 above
+        # max_body_size (64 KiB by default); use the app's own upload limit.
+        max_body_size = flask_app.config['MAX_CONTENT_LENGTH']
+        self.wsgi_app = ExecutorWSGIMiddleware(flask_app, ThreadPoolExecutor(wsgi.WSGI_THREADS, thread_name_prefix='wsgi'), max_body_size)
+        self.stream_app = ExecutorWSGIMiddleware(flask_app, ThreadPoolExecutor(wsgi.WSGI_STREAM_THREADS, thread_name_prefix='wsgi-stream'), max_body_size)
+        self.routes = Map([Rule(rule.rule, endpoint=rule.endpoint, methods=rule.methods)
+                           for rule in flask_app.url_map.iter_rules() if rule.endpoint != 'static']).bind('')
+
+    def endpoint(self, scope):
+        try: return self.routes.match(scope['path'], method=scope['method'])[0]
+        except HTTPException: return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan': return await self.quart_app(scope, receive, send)
+        endpoint = self.endpoint(scope) if scope['type'] == 'http' else None
+        if endpoint in ASYNC_VIEWS: return await self.quart_app(scope, receive, send)
+        if endpoint in STREAMING_ENDPOINTS: return await self.stream_app(scope, receive, send)
+        return await self.wsgi_app(scope, receive, send)
+
+def create_asgi_app(config=None):
+    flask_app = wsgi.create_app(config)
+    quart_app = Quart(__name__)
+    quart_app.config.update({key: value for key, value in flask_app.config.items() if key.startswith(('SECRET_KEY', 'SESSION_', 'PERMANENT_SESSION', 'MAX_CONTENT_LENGTH'))})
+    quart_app.jinja_env.loader = DictLoader(wsgi.TEMPLATE_SOURCES)
+    quart_app.jinja_env.autoescape = True
+    quart_app.jinja_env.globals['asset_url'] = wsgi.asset_url
+    for rule in flask_app.url_map.iter_rules():
+        if rule.endpoint == 'static': continue
+        quart_app.add_url_rule(rule.rule, rule.endpoint, ASYNC_VIEWS.get(rule.endpoint, served_by_wsgi), methods=rule.methods)
+
+    @quart_app.before_serving
+    async def startup():
+        global upload_slots
+        upload_slots = asyncio.Semaphore(wsgi.UPLOAD_CONCURRENCY)
+        await mongo.open()
+
+    @quart_app.after_serving
+    async def shutdown():
+        if upload_tasks: await asyncio.wait(upload_tasks, timeout=30)
+        await mongo.close()
+
+    @quart_app.before_request
+    async def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @quart_app.after_request
+    async def record_request_metrics(response):
+        labels = {'endpoint': request.endpoint or 'unmatched', 'method': request.method}
+        wsgi.metrics.observe('http_request_duration_seconds', time.perf_counter() - g.request_started, **labels)
+        wsgi.metrics.increment('http_requests_total', status=str(response.status_code), **labels)
+        if response.status_code >= 500: wsgi.metrics.increment('http_request_errors_total', **labels)
+        return response
+
+    @quart_app.after_request
+    async def compress_response(response):
+        if response.status_code != 200 or response.content_encoding or response.mimetype not in wsgi.COMPRESSIBLE_TYPES: return response
+        response.vary.add('Accept-Encoding')
+        compressed = wsgi.compressed_body(await response.get_data(), response.mimetype, request.accept_encodings)
+        if compressed:
+            response.content_encoding = compressed[0]
+            response.set_data(compressed[1])
+            wsgi.weaken_etag(response)
+        return response
+
+    return Dispatcher(quart_app, flask_app)
@@ -0,0 +1,118 @@
+"""WSGI versus ASGI under many concurrent clients: registration POSTs and
+owner/center dashboard GETs against real server processes.
+
+Starts each server command in turn on a local port, drives it with up to
+--concurrency simultaneous requests and reports p50/p95/p99 and throughput
+as JSON. Uses the data seeded by bench_load.py (seeded here unless --skip-seed):
+
+    BENCH_MONGO_URI=mongodb://localhost:27017/qr_load python benchmarks/bench_asgi.py --concurrency 1000
+    python benchmarks/bench_asgi.py --skip-seed --wsgi "gunicorn -w 4 --threads 16 -b 127.0.0.1:{port} 'app:create_app()'"
+
+Photos are uploaded to the local backend so both servers are measured
+without Cloudinary. The default WSGI command needs gunicorn installed.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_load  # noqa: E402
+from bench_load import FIRST_NAMES, LAST_NAMES, PASSWORD, SCALES, SCANS, qr_app, summarize  # noqa: E402
+
+os.environ["UPLOAD_BACKEND"] = "local"  # inherited by the server processes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVERS = {
+    'wsgi': "gunicorn --workers 4 --threads 16 --bind 127.0.0.1:{port} 'app:create_app()'",
+    'asgi': "hypercorn --workers 4 --bind 127.0.0.1:{port} 'asgi:create_asgi_app()'",
+}
+
+
+async def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get('/login')).status_code == 200: return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not come up.")
+
+
+async def drive(base_url, scenario, requests, concurrency, medical, center, photo):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        if scenario == 'owner_dashboard': await client.post('/owner-login', data={'username': medical['username'], 'password': PASSWORD})
+        if scenario == 'center_dashboard': await client.post('/center-login', data={'username': center['username'], 'password': PASSWORD})
+        slots = asyncio.Semaphore(concurrency)
+
+        async def one(_):
+            async with slots:
+                started = time.perf_counter()
+                try:
+                    if scenario == 'register':
+                        response = await client.post(f"/register/{medical['_id']}", files={'photo1': ('photo.png', photo, 'image/png')}, data={
+                            'name': f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}",
+                            'phone': f"9{random.randint(0, 999999999):09d}", 'ultrasound_name': random.choice(SCANS)})
+                    else:
+                        response = await client.get('/owner-dashboard' if scenario == 'owner_dashboard' else '/center-dashboard?all_dates=1')
+                    ok = response.status_code < 400
+                except httpx.HTTPError:
+                    ok = False
+                return (time.perf_counter() - started) * 1000, ok
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(one(i) for i in range(requests)))
+        return summarize(results, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='10k')
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--scenarios', default='register,owner_dashboard,center_dashboard')
+    parser.add_argument('--requests', type=int, default=5000, help="Requests per scenario.")
+    parser.add_argument('--concurrency', type=int, default=500)
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--wsgi', default=SERVERS['wsgi'], help="WSGI server command; {port} is substituted.")
+    parser.add_argument('--asgi', default=SERVERS['asgi'], help="ASGI server command; {port} is substituted.")
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    if not args.skip_seed: bench_load.seed(SCALES[args.scale], 365)
+    medical = qr_app.medicals_collection.find_one({'username': 'bench-medical-0'}, {'username': 1})
+    center = qr_app.centers_collection.find_one({'username': 'bench-center-0'}, {'username': 1})
+    if not medical or not center: sys.exit("No seeded data; run without --skip-seed first.")
+    photo = qr_app.generate_qr_code('load-test photo')
+
+    report = {'scale': args.scale, 'concurrency': args.concurrency, 'requests': args.requests, 'servers': {}}
+    for name, command in (('wsgi', args.wsgi), ('asgi', args.asgi)):
+        base_url = f"http://127.0.0.1:{args.port}"
+        server = subprocess.Popen(shlex.split(command.format(port=args.port)), cwd=ROOT, env=os.environ.copy(),
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            asyncio.run(wait_until_up(base_url))
+            report['servers'][name] = {'command': command, 'scenarios': {}}
+            for scenario in args.scenarios.split(','):
+                result = asyncio.run(drive(base_url, scenario, args.requests, args.concurrency, medical, center, photo))
+                report['servers'][name]['scenarios'][scenario] = result
+                print(f"{name} {scenario}: {result}", file=sys.stderr)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
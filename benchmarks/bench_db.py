@@ -0,0 +1,30 @@
+"""The database the benchmarks seed, drop and query.
+
+app.py connects to MONGO_URI, which .env may point at production, so the
+benchmarks never use it. They take BENCH_MONGO_URI instead, and refuse
+any database whose name does not mark it as a bench or load database:
+
+    BENCH_MONGO_URI=mongodb://localhost:27017/qr_load python benchmarks/bench_load.py
+"""
+import os
+import re
+import sys
+
+from pymongo.uri_parser import parse_uri
+
+BENCH_DATABASE = re.compile(r'(^|[_-])(bench|load)([_-]|$)')
+
+
+def require_bench_database(name):
+    if not name or not BENCH_DATABASE.search(name):
+        sys.exit(f"Refusing to use database {name!r}: benchmarks drop collections, so its name must contain "
+                 f"'bench' or 'load' (e.g. qr_bench, qr_load).")
+
+
+def use_bench_database():
+    """Point app.py at BENCH_MONGO_URI; call before `import app`."""
+    uri = os.environ.get('BENCH_MONGO_URI')
+    if not uri: sys.exit("Set BENCH_MONGO_URI to a throwaway database, e.g. mongodb://localhost:27017/qr_load.")
+    require_bench_database(parse_uri(uri).get('database'))
+    os.environ['MONGO_URI'] = uri
+    return uri
@@ -0,0 +1,57 @@
+"""Cold-start cost of the app: `import app` and `create_app()` in a fresh
+interpreter, checked against the tracked numbers in baselines.json.
+
+Neither step may open a network connection, so this runs without MongoDB:
+
+    python benchmarks/bench_import.py            # fail if >25% slower than the baseline
+    python benchmarks/bench_import.py --update   # record new baseline numbers
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+PROBE = """
+import time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+print((imported - start) * 1000, (time.perf_counter() - imported) * 1000)
+"""
+
+
+def cold_start():
+    env = {**os.environ, 'MONGO_URI': os.environ.get('MONGO_URI', 'mongodb://localhost:27017/qr_bench')}
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, check=True, capture_output=True, text=True).stdout
+    return [float(x) for x in out.split()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    parser.add_argument('--update', action='store_true', help="Write the measured medians to baselines.json.")
+    args = parser.parse_args()
+
+    runs = [cold_start() for _ in range(args.runs)]
+    measured = {'import_app_ms': round(statistics.median(r[0] for r in runs), 1),
+                'create_app_ms': round(statistics.median(r[1] for r in runs), 1)}
+    baselines = json.load(open(BASELINES)) if os.path.exists(BASELINES) else {}
+    if args.update:
+        baselines.update(measured)
+        with open(BASELINES, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+    regressions = [k for k, v in measured.items() if k in baselines and v > baselines[k] * (1 + args.tolerance)]
+    print(json.dumps({'runs': args.runs, 'measured': measured, 'baseline': {k: baselines.get(k) for k in measured},
+                      'regressions': regressions}, indent=2))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Patient insert throughput with the group-commit write buffer off and on.
+
+Simulates a registration burst: --threads request threads each insert
+patients as fast as they can, either with one insert_one per patient or
+through app.InsertBuffer at each --flush-ms setting. Reports throughput and
+per-insert latency percentiles as JSON. Needs a local MongoDB:
+
+    BENCH_MONGO_URI=mongodb://localhost:27017/qr_bench python benchmarks/bench_insert_buffer.py --threads 64 --inserts 20000
+
+For the full request path, run bench_load.py's register scenario with
+PATIENT_WRITE_BUFFER=0 and =1.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_db import require_bench_database  # noqa: E402
+from bench_load import qr_app, summarize  # noqa: E402
+
+
+def patient():
+    return qr_app.new_patient({'name': 'Bench Patient', 'phone': '9876543210', 'ultrasound_name': 'Whole Abdomen'},
+                              str(ObjectId()), {'center_id': ObjectId()}, [])
+
+
+def run(insert, inserts, threads):
+    def one(_):
+        started = time.perf_counter()
+        try:
+            insert(patient())
+            ok = True
+        except Exception:
+            ok = False
+        return (time.perf_counter() - started) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool: results = list(pool.map(one, range(inserts)))
+    return summarize(results, time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--inserts', type=int, default=20000)
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--max-batch', type=int, default=qr_app.WRITE_BUFFER_MAX_BATCH)
+    parser.add_argument('--flush-ms', default='1,5,20', help="Comma-separated flush latencies to try with the buffer on.")
+    args = parser.parse_args()
+
+    require_bench_database(qr_app.db.name)
+    collection = qr_app.db['bench_patient_inserts']
+    collection.drop()
+    report = {'inserts': args.inserts, 'threads': args.threads, 'max_batch': args.max_batch,
+              'buffer_off': run(collection.insert_one, args.inserts, args.threads), 'buffer_on': {}}
+    for flush_ms in (float(ms) for ms in args.flush_ms.split(',')):
+        before = dict(qr_app.metrics.counters)
+        buffer = qr_app.InsertBuffer(collection, args.max_batch, flush_ms / 1000)
+        result = run(buffer.insert, args.inserts, args.threads)
+        buffer.close()
+        batches = qr_app.metrics.counters.get(('patient_insert_batches_total', ()), 0) - before.get(('patient_insert_batches_total', ()), 0)
+        report['buffer_on'][f"{flush_ms:g}ms"] = {**result, 'mean_batch': round(args.inserts / max(batches, 1), 1)}
+    collection.drop()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Load test: registrations/second and dashboard, analytics and export latency
+under concurrent requests, at a chosen data scale.
+
+Seeds synthetic centers, QR owners and patients into a local MongoDB (never
+point this at production) and replaces cloudinary.uploader with a fake that
+only sleeps, so photo uploads cost latency but no network or account:
+
+    BENCH_MONGO_URI=mongodb://localhost:27017/qr_load python benchmarks/bench_load.py --scale 10k
+    python benchmarks/bench_load.py --scale 1m --skip-seed --concurrency 16 --out run.json --compare last.json
+
+Requests go through the Flask test client in worker threads, so numbers cover
+the app and MongoDB, not a WSGI server. Output is JSON with p50/p95/p99 and
+throughput per scenario; --compare prints p95 ratios against a previous run.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_db import require_bench_database, use_bench_database  # noqa: E402
+
+use_bench_database()
+os.environ.update({"ADMIN_USER": "bench-admin", "ADMIN_PASSWORD": "bench", "ADMIN_KEY": "bench", "UPLOAD_BACKEND": "cloudinary"})
+
+import pymongo  # noqa: E402
+import app as qr_app  # noqa: E402
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000, '10m': 10_000_000}
+PASSWORD = 'bench'
+FIRST_NAMES = ['Ravi', 'Priya', 'Amit', 'Sunita', 'Rahul', 'Anjali', 'Vikram', 'Neha', 'Suresh', 'Pooja', 'Arjun', 'Kavita']
+LAST_NAMES = ['Kumar', 'Sharma', 'Singh', 'Verma', 'Gupta', 'Yadav', 'Patel', 'Mishra', 'Jain', 'Reddy']
+SCANS = ['Whole Abdomen', 'Pelvis', 'KUB', 'Obstetric', 'Thyroid']
+
+
+class FakeCloudinary:
+    """Stands in for cloudinary.uploader.upload: sleeps for the configured latency and returns a URL."""
+    def __init__(self, latency_ms, jitter_ms):
+        self.latency_ms, self.jitter_ms, self.uploads, self.lock = latency_ms, jitter_ms, 0, threading.Lock()
+
+    def upload(self, file, **options):
+        time.sleep(max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000)
+        with self.lock: self.uploads += 1
+        return {'secure_url': f"https://res.cloudinary.invalid/bench/{ObjectId()}.jpg"}
+
+
+def seed(patients, days, batch_size=10000):
+    require_bench_database(qr_app.db.name)
+    centers, medicals = max(5, patients // 20000), max(20, patients // 1000)
+    for collection in (qr_app.centers_collection, qr_app.medicals_collection, qr_app.patients_collection,
+                       qr_app.daily_registrations_collection, qr_app.analytics_counters_collection):
+        collection.drop()
+    password = generate_password_hash(PASSWORD)
+    center_ids = qr_app.centers_collection.insert_many([
+        {'name': f"Bench Center {i}", 'address': 'Bench Road', 'username': f"bench-center-{i}", 'password': password}
+        for i in range(centers)]).inserted_ids
+    medical_rows = [{'name': f"Bench Medical {i}", 'center_id': center_ids[i % centers], 'username': f"bench-medical-{i}", 'password': password}
+                    for i in range(medicals)]
+    medical_ids = qr_app.medicals_collection.insert_many(medical_rows).inserted_ids
+    now = datetime.utcnow()
+    for offset in range(0, patients, batch_size):
+        batch = []
+        for _ in range(min(batch_size, patients - offset)):
+            medical = random.randrange(medicals)
+            name, phone = f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}", f"9{random.randint(0, 999999999):09d}"
+            timestamp = now - timedelta(minutes=random.randint(0, 60 * 24 * days))
+            batch.append({
+                'name': name, 'phone': phone, 'ultrasound_name': random.choice(SCANS),
+                'medical_id': medical_ids[medical], 'center_id': medical_rows[medical]['center_id'],
+                'timestamp': timestamp, 'updated_at': timestamp, 'status': random.choice(qr_app.PATIENT_STATUSES),
+                'center_visibility': random.choice(['hidden', 'visible']),
+                'photo_url_1': f"https://res.cloudinary.invalid/bench/{ObjectId()}.jpg", 'photo_url_2': '',
+                **qr_app.search_fields(name, phone),
+            })
+        qr_app.patients_collection.insert_many(batch, ordered=False)
+    qr_app.ensure_indexes()
+    qr_app.rebuild_daily_registrations()
+    qr_app.reconcile_analytics()
+    return {'centers': centers, 'medicals': medicals, 'patients': patients}
+
+
+def logged_in_client(app, role, center, medical):
+    client = app.test_client()
+    if role == 'admin': client.post('/login', data={'username': 'bench-admin', 'password': PASSWORD})
+    if role == 'center': client.post('/center-login', data={'username': center['username'], 'password': PASSWORD})
+    if role == 'owner': client.post('/owner-login', data={'username': medical['username'], 'password': PASSWORD})
+    return client
+
+
+def scenarios(photo):
+    """name -> (role to log in as, callable(client, center, medical) returning a response)."""
+    return {
+        'center_login': (None, lambda c, center, medical: c.post('/center-login', data={'username': center['username'], 'password': PASSWORD})),
+        'register': (None, lambda c, center, medical: c.post(f"/register/{medical['_id']}", content_type='multipart/form-data', data={
+            'name': f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}", 'phone': f"9{random.randint(0, 999999999):09d}",
+            'ultrasound_name': random.choice(SCANS), 'photo1': (qr_app.io.BytesIO(photo), 'photo.png')})),
+        'admin_dashboard': ('admin', lambda c, center, medical: c.get('/admin')),
+        'center_dashboard': ('center', lambda c, center, medical: c.get('/center-dashboard?all_dates=1')),
+        'center_search': ('center', lambda c, center, medical: c.get(f"/center-dashboard?all_dates=1&search_query={random.choice(FIRST_NAMES).lower()}")),
+        'owner_dashboard': ('owner', lambda c, center, medical: c.get('/owner-dashboard')),
+        'analytics': ('admin', lambda c, center, medical: c.get('/analytics')),
+        'center_export': ('center', lambda c, center, medical: c.get('/center-dashboard/export?format=csv&status=Complete')),
+    }
+
+
+def run_scenario(app, role, call, centers, medicals, requests, concurrency):
+    local = threading.local()
+
+    def one(_):
+        if not hasattr(local, 'client'):
+            local.center, local.medical = random.choice(centers), random.choice(medicals)
+            local.client = logged_in_client(app, role, local.center, local.medical)
+        started = time.perf_counter()
+        response = call(local.client, local.center, local.medical)
+        response.get_data()
+        return (time.perf_counter() - started) * 1000, response.status_code < 400
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool: results = list(pool.map(one, range(requests)))
+    return summarize(results, time.perf_counter() - started)
+
+
+def summarize(results, elapsed):
+    """Latency percentiles and throughput for a list of (latency ms, succeeded) pairs."""
+    latencies = [ms for ms, _ in results]
+    cuts = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(results), 'errors': sum(1 for _, ok in results if not ok), 'throughput_rps': round(len(results) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies), 2), 'p50_ms': round(cuts[49], 2), 'p95_ms': round(cuts[94], 2), 'p99_ms': round(cuts[98], 2),
+    }
+
+
+def main():
+    all_scenarios = list(scenarios(b''))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='10k', help="Number of seeded patients.")
+    parser.add_argument('--days', type=int, default=365, help="Spread seeded registrations over this many days.")
+    parser.add_argument('--skip-seed', action='store_true', help="Reuse the data from a previous run at the same scale.")
+    parser.add_argument('--scenarios', default=','.join(all_scenarios), help=f"Comma-separated subset of: {', '.join(all_scenarios)}.")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per scenario.")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--upload-latency-ms', type=float, default=400)
+    parser.add_argument('--upload-jitter-ms', type=float, default=100)
+    parser.add_argument('--seed', type=int, default=1234, help="Random seed, so runs at the same scale see the same data.")
+    parser.add_argument('--out', help="Also write the JSON report to this file.")
+    parser.add_argument('--compare', help="A previous report; prints p95 ratios (new / old) per scenario.")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    fake = FakeCloudinary(args.upload_latency_ms, args.upload_jitter_ms)
+    qr_app.cloudinary.uploader.upload = fake.upload
+    app = qr_app.create_app({'TESTING': True})
+
+    seeded = None if args.skip_seed else seed(SCALES[args.scale], args.days)
+    centers = list(qr_app.centers_collection.find({'username': {'$regex': '^bench-center-'}}, {'username': 1}))
+    medicals = list(qr_app.medicals_collection.find({'username': {'$regex': '^bench-medical-'}}, {'username': 1}))
+    if not centers or not medicals: sys.exit("No seeded data; run without --skip-seed first.")
+
+    photo = qr_app.generate_qr_code('load-test photo')
+    report = {
+        'scale': args.scale, 'seeded': seeded, 'seed': args.seed, 'concurrency': args.concurrency,
+        'upload_latency_ms': args.upload_latency_ms, 'scenarios': {},
+        'environment': {'python': platform.python_version(), 'pymongo': pymongo.version, 'cpus': os.cpu_count()},
+    }
+    available = scenarios(photo)
+    for name in args.scenarios.split(','):
+        role, call = available[name]
+        report['scenarios'][name] = run_scenario(app, role, call, centers, medicals, args.requests, args.concurrency)
+        print(f"{name}: {report['scenarios'][name]}", file=sys.stderr)
+
+    started = time.perf_counter()
+    qr_app.upload_executor.shutdown(wait=True)  # let every queued photo upload finish
+    report['photo_uploads'] = {'completed': fake.uploads, 'drain_seconds': round(time.perf_counter() - started, 2)}
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, 'w') as f: f.write(output + '\n')
+    if args.compare:
+        previous = json.load(open(args.compare))['scenarios']
+        for name, result in report['scenarios'].items():
+            if name in previous: print(f"{name}: p95 x{result['p95_ms'] / previous[name]['p95_ms']:.2f}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Page weight: bytes transferred for each page's HTML at every
+Content-Encoding, plus the stylesheets, scripts and icons it references.
+
+Same-origin assets are fetched through the app; CDN ones are downloaded once
+with the same Accept-Encoding (needs network; --offline lists them unweighed).
+For before/after numbers, run it against an older checkout as well:
+
+    git worktree add /tmp/qr-before <commit>
+    python benchmarks/bench_page_weight.py --app-dir /tmp/qr-before --out before.json
+    python benchmarks/bench_page_weight.py --compare before.json
+
+The register page and the dashboards use the data bench_load.py seeds into
+BENCH_MONGO_URI; without it only the public pages are measured.
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import urllib.request
+
+from pymongo.errors import PyMongoError
+
+from bench_db import use_bench_database
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'bench'
+ACCEPT = 'br, gzip'
+PAGES = {
+    'login': (None, '/login'), 'center_login': (None, '/center-login'), 'owner_login': (None, '/owner-login'),
+    'register': (None, '/register/{medical_id}'), 'success': (None, '/success'),
+    'admin': ('admin', '/admin'), 'analytics': ('admin', '/analytics'),
+    'center_dashboard': ('center', '/center-dashboard'), 'owner_dashboard': ('owner', '/owner-dashboard'),
+}
+LINK = re.compile(r'<link\b[^>]*>', re.I)
+SCRIPT = re.compile(r'<script\b[^>]*\bsrc="([^"]+)"[^>]*>', re.I)
+USE = re.compile(r'<use\b[^>]*\bhref="([^"#]+)', re.I)
+NOSCRIPT = re.compile(r'<noscript>.*?</noscript>', re.I | re.S)
+
+
+def subresources(html):
+    """(url, render blocking) for each stylesheet, script and SVG sprite a page loads."""
+    found = {}
+    for tag in LINK.findall(html):
+        rel, href = re.search(r'rel="([^"]+)"', tag), re.search(r'href="([^"]+)"', tag)
+        if not rel or not href or rel.group(1) not in ('stylesheet', 'preload'): continue
+        found.setdefault(href.group(1), rel.group(1) == 'stylesheet' and tag in NOSCRIPT.sub('', html))
+    head = html.split('</head>', 1)[0]
+    for src in SCRIPT.findall(html): found.setdefault(src, src in head and not re.search(r'\b(async|defer)\b', head))
+    for href in USE.findall(html): found.setdefault(href, False)
+    return found
+
+
+def transferred(client, url, external, offline):
+    if not url.startswith(('http://', 'https://', '//')): return len(client.get(url, headers={'Accept-Encoding': ACCEPT}).data)
+    if offline: return None
+    if url not in external:
+        request = urllib.request.Request(url if url.startswith('http') else f"https:{url}",
+                                         headers={'Accept-Encoding': ACCEPT, 'User-Agent': 'Mozilla/5.0'})
+        with urllib.request.urlopen(request, timeout=30) as response: external[url] = len(response.read())
+    return external[url]
+
+
+def weigh(client, path, external, offline):
+    html = client.get(path).get_data(as_text=True)
+    encoded = {encoding: len(client.get(path, headers={'Accept-Encoding': encoding}).data) for encoding in ('identity', 'gzip', 'br')}
+    resources = [{'url': url, 'blocking': blocking, 'self_hosted': not url.startswith(('http', '//')),
+                  'bytes': transferred(client, url, external, offline)} for url, blocking in subresources(html).items()]
+    return {
+        'path': path, 'html_bytes': encoded, 'render_blocking_requests': sum(r['blocking'] for r in resources),
+        'external_requests': sum(not r['self_hosted'] for r in resources), 'subresources': resources,
+        'first_visit_bytes': min(encoded.values()) + sum(r['bytes'] or 0 for r in resources),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app-dir', default=ROOT, help="Checkout whose app.py to measure.")
+    parser.add_argument('--pages', default=','.join(PAGES), help=f"Comma-separated subset of: {', '.join(PAGES)}.")
+    parser.add_argument('--offline', action='store_true', help="Do not download CDN resources.")
+    parser.add_argument('--out', help="Also write the JSON report to this file.")
+    parser.add_argument('--compare', help="A previous report; prints first-visit and HTML byte ratios (new / old).")
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.path.abspath(args.app_dir))
+    use_bench_database()
+    os.environ.update({"ADMIN_USER": "bench-admin", "ADMIN_PASSWORD": PASSWORD})
+    import app as qr_app
+
+    flask_app = qr_app.create_app({'TESTING': True}) if hasattr(qr_app, 'create_app') else qr_app.app
+    try:
+        medical = qr_app.medicals_collection.find_one({'username': 'bench-medical-0'}, {'username': 1})
+        center = qr_app.centers_collection.find_one({'username': 'bench-center-0'}, {'username': 1})
+    except PyMongoError:
+        medical = center = None
+    logins = {'admin': ('/login', 'bench-admin'), 'center': ('/center-login', center and center['username']),
+              'owner': ('/owner-login', medical and medical['username'])}
+
+    report, external = {'app_dir': os.path.abspath(args.app_dir), 'accept_encoding': ACCEPT, 'pages': {}}, {}
+    for name in args.pages.split(','):
+        role, path = PAGES[name]
+        if (role and not logins[role][1]) or ('{medical_id}' in path and not medical):
+            print(f"{name}: skipped, no seeded data (run bench_load.py first)", file=sys.stderr)
+            continue
+        client = flask_app.test_client()
+        if role: client.post(logins[role][0], data={'username': logins[role][1], 'password': PASSWORD})
+        report['pages'][name] = weigh(client, path.format(medical_id=medical and medical['_id']), external, args.offline)
+        print(f"{name}: {report['pages'][name]['html_bytes']} first visit {report['pages'][name]['first_visit_bytes']}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.out:
+        with open(args.out, 'w') as f: f.write(output + '\n')
+    if args.compare:
+        previous = json.load(open(args.compare))['pages']
+        for name, page in report['pages'].items():
+            if name not in previous: continue
+            old = previous[name]
+            print(f"{name}: first visit {old['first_visit_bytes']} -> {page['first_visit_bytes']} bytes "
+                  f"(x{page['first_visit_bytes'] / old['first_visit_bytes']:.2f}), HTML {min(old['html_bytes'].values())} -> "
+                  f"{min(page['html_bytes'].values())}, blocking requests {old['render_blocking_requests']} -> {page['render_blocking_requests']}",
+                  file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Center dashboard search latency: the legacy unanchored case-insensitive $regex
+versus index-backed name-token / phone-digit prefix lookups.
+
+Seeds a local MongoDB (never point this at production):
+
+    BENCH_MONGO_URI=mongodb://localhost:27017/qr_bench python benchmarks/bench_search.py --patients 1000000
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_db import require_bench_database, use_bench_database  # noqa: E402
+
+use_bench_database()
+
+import app as qr_app  # noqa: E402
+
+FIRST_NAMES = ['Ravi', 'Priya', 'Amit', 'Sunita', 'Rahul', 'Anjali', 'Vikram', 'Neha', 'Suresh', 'Pooja', 'Arjun', 'Kavita']
+LAST_NAMES = ['Kumar', 'Sharma', 'Singh', 'Verma', 'Gupta', 'Yadav', 'Patel', 'Mishra', 'Jain', 'Reddy']
+QUERIES = ['ravi', 'priya sharma', 'kum', '98765', '9876543']
+
+
+def seed(patients, centers, batch_size=10000):
+    require_bench_database(qr_app.db.name)
+    qr_app.patients_collection.drop()
+    center_ids = [ObjectId() for _ in range(centers)]
+    now = datetime.utcnow()
+    for offset in range(0, patients, batch_size):
+        batch = []
+        for _ in range(min(batch_size, patients - offset)):
+            name = f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}"
+            phone = f"9{random.randint(0, 999999999):09d}"
+            batch.append({
+                'name': name, 'phone': phone, 'ultrasound_name': 'Whole Abdomen', 'medical_id': ObjectId(),
+                'center_id': random.choice(center_ids), 'timestamp': now - timedelta(minutes=random.randint(0, 60 * 24 * 365)),
+                'status': 'Pending', 'center_visibility': 'visible', **qr_app.search_fields(name, phone),
+            })
+        qr_app.patients_collection.insert_many(batch, ordered=False)
+    qr_app.ensure_indexes()
+    return center_ids
+
+
+def legacy_filter(search_query):
+    return {"$or": [{"name": {"$regex": search_query, "$options": "i"}}, {"phone": {"$regex": search_query, "$options": "i"}}]}
+
+
+def measure(center_ids, make_filter, repeat):
+    timings = []
+    for _ in range(repeat):
+        for search_query in QUERIES:
+            query = {"center_id": random.choice(center_ids), "center_visibility": "visible", **make_filter(search_query)}
+            start = time.perf_counter()
+            qr_app.paginate(qr_app.patients_collection, query, qr_app.CENTER_DASHBOARD_FIELDS)
+            qr_app.patients_collection.count_documents(query)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {'p50_ms': round(statistics.median(timings), 2), 'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 2), 'samples': len(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=1000000)
+    parser.add_argument('--centers', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--skip-seed', action='store_true', help="Reuse the existing bench collection.")
+    args = parser.parse_args()
+
+    if args.skip_seed:
+        center_ids = qr_app.patients_collection.distinct('center_id')
+    else:
+        center_ids = seed(args.patients, args.centers)
+    print(json.dumps({
+        'patients': qr_app.patients_collection.estimated_document_count(),
+        'regex_all_dates': measure(center_ids, legacy_filter, args.repeat),
+        'indexed_all_dates': measure(center_ids, qr_app.search_filter, args.repeat),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
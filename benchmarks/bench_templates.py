@@ -0,0 +1,69 @@
+"""Compare per-request page rendering: two render_template_string passes vs the
+precompiled single-pass template registry.
+
+    python benchmarks/bench_templates.py --patients 50 --iterations 500
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from bson import ObjectId
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017/bench")
+os.environ.setdefault("ADMIN_KEY", "bench")
+
+from flask import render_template_string  # noqa: E402
+import app as qr_app  # noqa: E402
+
+
+def fake_patients(count):
+    return [{
+        '_id': ObjectId(), 'name': f'Patient {i}', 'phone': f'98765{i:05d}', 'ultrasound_name': 'Whole Abdomen',
+        'timestamp': datetime.utcnow(), 'status': 'Pending', 'center_visibility': 'hidden' if i % 2 else 'visible',
+        'photo_url_1': 'https://example.com/1.jpg', 'photo_url_2': '',
+    } for i in range(count)]
+
+
+# The layout as it was before it grew a `content` block.
+LEGACY_LAYOUT = qr_app.ADMIN_LAYOUT_TEMPLATE.replace("{% block content %}{% endblock %}", "{{ content | safe }}")
+
+
+def legacy_render(title, content, **context):
+    return render_template_string(LEGACY_LAYOUT, title=title, content=render_template_string(content, **context))
+
+
+def time_it(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations): fn()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--patients', type=int, default=50)
+    parser.add_argument('--iterations', type=int, default=500)
+    args = parser.parse_args()
+
+    patients = fake_patients(args.patients)
+    app = qr_app.create_app()
+    with app.test_request_context('/owner-dashboard'):
+        from flask import session
+        session['owner_id'], session['owner_name'] = str(ObjectId()), 'Bench Owner'
+        legacy = time_it(lambda: legacy_render("Bench", qr_app.OWNER_DASHBOARD_TEMPLATE, patients=patients), args.iterations)
+        registry = time_it(lambda: qr_app.render_page("Bench", 'owner_dashboard', patients=patients), args.iterations)
+        legacy_login = time_it(lambda: legacy_render("Bench", qr_app.LOGIN_TEMPLATE), args.iterations)
+        registry_login = time_it(lambda: qr_app.render_page("Bench", 'login'), args.iterations)
+
+    print(json.dumps({
+        'patients': args.patients, 'iterations': args.iterations,
+        'owner_dashboard_ms': {'render_template_string': round(legacy, 3), 'registry': round(registry, 3), 'speedup': round(legacy / registry, 1)},
+        'login_ms': {'render_template_string': round(legacy_login, 3), 'registry': round(registry_login, 3), 'speedup': round(legacy_login / registry_login, 1)},
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Center dashboard live updates against a real single-node replica set.
+
+Skipped unless TEST_REPLICA_SET_URI names a throwaway database on one, e.g.:
+
+    mongod --replSet rs0 --port 27017 --dbpath /tmp/rs0 --fork --logpath /tmp/rs0.log
+    mongosh --eval 'rs.initiate()'
+    TEST_REPLICA_SET_URI='mongodb://localhost:27017/qr_test?replicaSet=rs0' python -m pytest tests
+"""
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+import app as qr_app
+
+URI = os.environ.get('TEST_REPLICA_SET_URI')
+DAY = datetime(2026, 1, 15)
+pytestmark = pytest.mark.skipif(not URI, reason="TEST_REPLICA_SET_URI is not set")
+
+
+@pytest.fixture
+def center(monkeypatch):
+    flask_app = qr_app.create_app({'TESTING': True, 'MONGO_URI': URI})
+    monkeypatch.setattr(qr_app, 'SSE_HEARTBEAT_SECONDS', 1)
+    center_id = ObjectId()
+    client = flask_app.test_client()
+    with client.session_transaction() as session: session['center_id'] = str(center_id)
+    yield client, center_id
+    qr_app.patients_collection.delete_many({'center_id': center_id})
+
+
+def patient(center_id, name, updated_at):
+    return {'name': name, 'phone': '9876543210', 'ultrasound_name': 'Whole Abdomen', 'medical_id': ObjectId(), 'center_id': center_id,
+            'timestamp': DAY + timedelta(hours=10), 'updated_at': updated_at, 'status': 'Pending', 'center_visibility': 'visible'}
+
+
+def test_change_stream_sends_rendered_row_with_resume_id(center):
+    client, center_id = center
+    response = client.get(f"/center-dashboard/stream?filter_date={DAY:%Y-%m-%d}", buffered=False)
+    chunks = iter(response.response)
+    try:
+        assert next(chunks).decode().startswith('retry:')  # the change stream is open
+        patient_id = qr_app.patients_collection.insert_one(patient(center_id, 'Stream Patient', datetime.utcnow())).inserted_id
+        event = next(c.decode() for c in chunks if c.startswith(b'id:'))
+    finally:
+        response.close()
+    resume_id, data = event.strip().split('\n')
+    row = json.loads(data.removeprefix('data: '))
+    assert resume_id.removeprefix('id: ')
+    assert row['id'] == str(patient_id)
+    assert 'Stream Patient' in row['html'] and f'id="patient-{patient_id}"' in row['html']
+
+
+def test_changes_page_through_rows_sharing_one_updated_at(center, monkeypatch):
+    client, center_id = center
+    monkeypatch.setattr(qr_app, 'MAX_PAGE_SIZE', 5)
+    stamp = datetime.utcnow().replace(microsecond=0)
+    inserted = qr_app.patients_collection.insert_many([patient(center_id, f"Bulk {i}", stamp) for i in range(12)]).inserted_ids
+    since, seen, more = (stamp - timedelta(seconds=1)).isoformat(), [], True
+    while more:
+        data = client.get(f"/center-dashboard/changes?filter_date={DAY:%Y-%m-%d}&since={since}").get_json()
+        seen += [row['id'] for row in data['rows']]
+        since, more = data['since'], data['more']
+    assert seen == sorted(str(i) for i in inserted)
@@ -0,0 +1,35 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+import app as qr_app
+
+SCRIPT = '<script>alert(1)</script>'
+
+
+def patient():
+    return {'_id': ObjectId(), 'name': SCRIPT, 'phone': '9876543210', 'ultrasound_name': SCRIPT,
+            'status': 'Pending', 'timestamp': datetime.utcnow(), 'center_visibility': 'visible'}
+
+
+def test_patient_fields_are_escaped():
+    flask_app = qr_app.create_app({'TESTING': True})
+    with flask_app.test_request_context('/center-dashboard'):
+        html = qr_app.render_template('center_patient_row', p=patient())
+    assert SCRIPT not in html
+    assert '&lt;script&gt;alert(1)&lt;/script&gt;' in html
+
+
+def test_patient_fields_are_escaped_under_asgi():
+    asgi = pytest.importorskip('asgi')
+    quart_app = asgi.create_asgi_app().quart_app
+
+    async def render():
+        async with quart_app.test_request_context('/center-dashboard'):
+            return await asgi.render_template('center_patient_row', p=patient())
+
+    html = asyncio.run(render())
+    assert SCRIPT not in html
+    assert '&lt;script&gt;alert(1)&lt;/script&gt;' in html